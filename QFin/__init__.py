@@ -1,14 +1,49 @@
-from qfin.options import BlackScholesCall
-from qfin.options import BlackScholesPut
-from qfin.simulations import GeometricBrownianMotion
-from qfin.simulations import StochasticVarianceModel
-from qfin.simulations import MonteCarloBinaryCall
-from qfin.simulations import MonteCarloBinaryPut
-from qfin.simulations import MonteCarloCall
-from qfin.simulations import MonteCarloPut
-from qfin.simulations import MonteCarloBarrierCall
-from qfin.simulations import MonteCarloBarrierPut
-from qfin.simulations import MonteCarloAsianCall
-from qfin.simulations import MonteCarloAsianPut
-from qfin.simulations import MonteCarloExtendibleCall
-from qfin.simulations import MonteCarloExtendiblePut
+import importlib
+
+# Classes are imported from their module on first access (PEP 562), so importing the package stays cheap
+_EXPORTS = {
+    "BlackScholesCall": "options",
+    "BlackScholesPut": "options",
+    "BlackScholesChain": "options",
+    "BlackScholesImpliedVolatility": "options",
+    "GeometricAsianOption": "options",
+    "TurnbullWakemanAsianOption": "options",
+    "GeometricBrownianMotion": "simulations",
+    "StochasticVarianceModel": "simulations",
+    "MonteCarloBinaryCall": "simulations",
+    "MonteCarloBinaryPut": "simulations",
+    "MonteCarloCall": "simulations",
+    "MonteCarloPut": "simulations",
+    "MonteCarloBarrierCall": "simulations",
+    "MonteCarloBarrierPut": "simulations",
+    "MonteCarloAsianCall": "simulations",
+    "MonteCarloAsianPut": "simulations",
+    "MonteCarloExtendibleCall": "simulations",
+    "MonteCarloExtendiblePut": "simulations",
+    "MonteCarloAmericanCall": "simulations",
+    "MonteCarloAmericanPut": "simulations",
+    "MonteCarloPayoffBook": "simulations",
+    "MonteCarloAccumulator": "simulations",
+    "MonteCarloParallel": "simulations",
+    "MonteCarloStream": "simulations",
+    "PricingCache": "cache",
+    "Instrumentation": "instrumentation",
+    "ScenarioStore": "scenarios",
+    "CrankNicolsonCall": "pde",
+    "CrankNicolsonPut": "pde",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+    value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    # cache on the package so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,173 @@
+import inspect
+import math
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .simulations import _PathRecording
+
+# Names the pricers in this package give their spot argument
+SPOT_ARGUMENTS = ("asset_price", "S")
+
+
+# Hashable copy of a bit generator state (nested dicts of integers and arrays), kept exact
+def _state(value):
+    if isinstance(value, dict):
+        return tuple((k, _state(v)) for k, v in sorted(value.items()))
+    if isinstance(value, np.ndarray):
+        return value.shape, tuple(value.ravel().tolist())
+    return value
+
+
+# Hashable key of a pricer argument, numbers are rounded to multiples of tolerance so quotes that differ by less
+# than it share an entry. Random generators are keyed on their state, the draws they are about to make, so a fresh
+# default_rng(seed) per call hits the entry of that seed and a generator that has moved on does not
+def _quantize(value, tolerance):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, np.random.Generator):
+        value = value.bit_generator
+    if isinstance(value, np.random.BitGenerator):
+        return _state(value.state)
+    if isinstance(value, np.random.RandomState):
+        return _state(value.get_state(legacy=False))
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value)
+        return "nan" if math.isnan(value) else round(value/tolerance)
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in "biuf":
+            return value.shape, tuple(_quantize(v, tolerance) for v in value.ravel().tolist())
+        return value.shape, tuple(value.ravel().tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(_quantize(v, tolerance) for v in value)
+    return value
+
+
+# Memoizes pricer results on quantized arguments with least recently used eviction and an optional time to live
+# (seconds). With incremental=True a miss that differs from a cached entry only in the spot reprices from that
+# entry: analytic results through their at_spot method (BlackScholesCall/Put, BlackScholesChain, CrankNicolson) and
+# Monte Carlo pricers by replaying the paths drawn for the entry scaled to the new spot, so a spot tick costs a
+# payoff evaluation and not a simulation. A hit leaves a generator passed as rng where it was
+class PricingCache:
+
+    def _signature(self, pricer):
+        if pricer not in self.signatures:
+            try:
+                self.signatures[pricer] = inspect.signature(pricer)
+            except (TypeError, ValueError):
+                self.signatures[pricer] = None
+        return self.signatures[pricer]
+
+    # (name, value) of the spot argument of the call, None when the pricer has none
+    def _spot(self, pricer, args, kwargs):
+        signature = self._signature(pricer)
+        if signature is None:
+            return None
+        try:
+            bound = signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+        for name in SPOT_ARGUMENTS:
+            if name in bound.arguments:
+                return name, bound
+        return None
+
+    def _key(self, pricer, args, kwargs):
+        return pricer, _quantize(args, self.tolerance), _quantize(sorted(kwargs.items()), self.tolerance)
+
+    # cached value of key or None, moving it to the most recently used end
+    def _lookup(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, stamp = entry
+        if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+            del entries[key]
+            self.expirations += 1
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def _store(self, entries, key, value, max_size):
+        entries[key] = (value, time.monotonic())
+        entries.move_to_end(key)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def price(self, pricer, *args, **kwargs):
+        key = self._key(pricer, args, kwargs)
+        with self.lock:
+            entry = self._lookup(self.entries, key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            spot = self._spot(pricer, args, kwargs) if self.incremental else None
+            base = None
+            if spot is not None:
+                name, bound = spot
+                spot_value = bound.arguments.pop(name)
+                base_key = self._key(pricer, bound.args, bound.kwargs)
+                base = self._lookup(self.bases, base_key)
+        # pricing runs outside the lock so other threads are not held up
+        result = None
+        if base is not None and hasattr(base[0], "at_spot"):
+            result = base[0].at_spot(spot_value)
+            incremental = True
+            # a spot off the grid of a finite difference entry reads NaN, it is priced afresh and becomes the entry
+            if not np.all(np.isfinite(result.price)):
+                base = result = None
+        elif base is not None:
+            with _PathRecording(base[0]) as replay:
+                result = pricer(*args, **kwargs)
+            # the pricer drew every path from the recording, otherwise it simulated and the result is still exact
+            incremental = replay.position == len(base[0])
+        if result is None:
+            recording = _PathRecording()
+            if spot is not None:
+                with recording:
+                    result = pricer(*args, **kwargs)
+            else:
+                result = pricer(*args, **kwargs)
+        with self.lock:
+            if base is not None:
+                self.incremental_hits += incremental
+            elif spot is not None and hasattr(result, "at_spot"):
+                self._store(self.bases, base_key, result, self.max_bases)
+            elif spot is not None and recording.calls:
+                self._store(self.bases, base_key, recording.calls, self.max_bases)
+            self._store(self.entries, key, result, self.max_size)
+        return result
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return (self.hits + self.incremental_hits)/calls if calls else 0.
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bases.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # tolerance: quantization step of numeric arguments, max_size: results kept, ttl: seconds a result stays valid
+    # (None keeps it until evicted), incremental: reprice spot ticks from cached entries, max_bases: entries kept
+    # for incremental repricing (Monte Carlo bases hold their paths)
+    def __init__(self, tolerance=1e-8, max_size=1024, ttl=None, incremental=False, max_bases=16):
+        self.tolerance = tolerance
+        self.max_size = max_size
+        self.ttl = ttl
+        self.incremental = incremental
+        self.max_bases = max_bases
+        self.entries = OrderedDict()
+        self.bases = OrderedDict()
+        self.signatures = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.incremental_hits = 0
+        self.evictions = 0
+        self.expirations = 0
@@ -0,0 +1,153 @@
+import threading
+import time
+
+# Stage timers and counters for the pricing pipeline. Nothing is recorded unless an Instrumentation is active on the
+# thread, so the hooks in simulations.py and options.py cost one attribute lookup per engine call when it is not:
+#
+#   with Instrumentation(memory=True) as stats:
+#       MonteCarloBarrierCall(100, 100000, 150, .01, 100, 0, .3, 1/252, 1)
+#   print(stats.as_dict())
+#
+# Stages of the simulation pipeline: "rng" (random draws), "diffusion" (path stepping, excluding its rng time),
+# "payoff" (payoff evaluation and discounting, the time between the engine and the statistics), "estimate"
+# (Monte Carlo statistics), "greeks" and "regression" (Longstaff-Schwartz exercise), plus "black_scholes" and
+# "implied_volatility" for the analytic chains and "pde" for the finite difference pricers. Counters: "paths",
+# "path_steps", "rng_draws", "barrier_hits", "extended_paths", "options", "implied_volatility_iterations" and
+# "pde_solves". Processes started by MonteCarloParallel are not instrumented
+_local = threading.local()
+
+
+def active():
+    return getattr(_local, "active", None)
+
+
+class _Stage:
+
+    def __enter__(self):
+        self.instrumentation._enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.instrumentation._exit()
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+
+class _NoStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+# Times the block as stage name of the active instrumentation, a shared no-op when there is none
+def stage(name):
+    instrumentation = getattr(_local, "active", None)
+    if instrumentation is None:
+        return _NO_STAGE
+    return _Stage(instrumentation, name)
+
+
+def count(name, value=1):
+    instrumentation = getattr(_local, "active", None)
+    if instrumentation is not None:
+        instrumentation.counters[name] = instrumentation.counters.get(name, 0) + int(value)
+
+
+# Attributes the time since the last stage ended to stage name (work between stages that has no block of its own)
+def lap(name):
+    instrumentation = getattr(_local, "active", None)
+    if instrumentation is not None and instrumentation.mark is not None:
+        now = time.perf_counter()
+        instrumentation._record(name, now - instrumentation.mark, now - instrumentation.mark)
+        instrumentation.mark = None
+
+
+# Collects stage timers, counters and optionally traced memory high-water marks (tracemalloc, which slows numpy
+# allocation noticeably) while active as a context manager on the current thread. Stage "seconds" include nested
+# stages and "self_seconds" exclude them, callback(name, seconds, instrumentation) is called as every stage ends
+class Instrumentation:
+
+    def _fold_memory(self):
+        peak = self.tracemalloc.get_traced_memory()[1]
+        for frame in self.stack:
+            frame[3] = max(frame[3], peak)
+        self.peak_memory = max(self.peak_memory, peak)
+        self.tracemalloc.reset_peak()
+
+    def _enter(self, name):
+        if self.memory:
+            self._fold_memory()
+        # name, start, time spent in nested stages, memory high-water mark
+        self.stack.append([name, time.perf_counter(), 0., 0])
+
+    def _exit(self):
+        if self.memory:
+            self._fold_memory()
+        name, start, nested, peak = self.stack.pop()
+        self.mark = time.perf_counter()
+        seconds = self.mark - start
+        self._record(name, seconds, seconds - nested, peak)
+
+    def _record(self, name, seconds, self_seconds, peak=None):
+        stats = self.stages.setdefault(name, {"calls": 0, "seconds": 0., "self_seconds": 0.})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["self_seconds"] += self_seconds
+        if peak is not None and self.memory:
+            stats["peak_memory"] = max(stats.get("peak_memory", 0), peak)
+        if self.stack:
+            self.stack[-1][2] += seconds
+        if self.callback is not None:
+            self.callback(name, seconds, self)
+
+    def __enter__(self):
+        self.previous = getattr(_local, "active", None)
+        if self.memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        _local.active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.active = self.previous
+        self.seconds += time.perf_counter() - self.start
+        if self.memory:
+            self._fold_memory()
+            if self.started_tracing:
+                self.tracemalloc.stop()
+
+    def as_dict(self):
+        stats = {"seconds": self.seconds, "stages": {name: dict(stage) for name, stage in self.stages.items()}, "counters": dict(self.counters)}
+        if self.memory:
+            stats["peak_memory"] = self.peak_memory
+        return stats
+
+    def to_json(self, **kwargs):
+        import json
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.seconds = 0.
+        self.peak_memory = 0
+        self.mark = None
+
+    # memory: record traced peak memory per stage, callback: called as callback(name, seconds, self) after every stage
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.stack = []
+        self.reset()
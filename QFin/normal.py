@@ -0,0 +1,90 @@
+import math
+import numpy as np
+
+# Standard normal cdf, pdf and inverse cdf without SciPy
+# Python scalars go through math.erfc, arrays through NumPy ufuncs
+
+SQRT_2 = math.sqrt(2)
+SQRT_2PI = math.sqrt(2*math.pi)
+
+# Acklam's rational approximation of the inverse cdf, refined to full precision by a Halley step
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01, 1.)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00, 1.)
+_P_LOW = .02425
+
+# Hart's double precision rational approximation of the lower tail (as given by West), 1e-15 accurate
+_HART_P = (3.52624965998911e-02, .700383064443688, 6.37396220353165, 33.912866078383, 112.079291497871, 221.213596169931, 220.206867912376)
+_HART_Q = (8.83883476483184e-02, 1.75566716318264, 16.064177579207, 86.7807322029461, 296.564248779674, 637.333633378831, 793.826512519948, 440.413735824752)
+
+
+def _is_scalar(x):
+    return isinstance(x, (float, int))
+
+
+def _polynomial(coefficients, x):
+    value = coefficients[0]
+    for c in coefficients[1:]:
+        value = value*x + c
+    return value
+
+
+# lower tail probability of |x|, evaluated without cancellation
+def _lower_tail(x):
+    x = np.abs(x)
+    with np.errstate(over="ignore", under="ignore", invalid="ignore", divide="ignore"):
+        exponential = np.exp(-.5*x*x)
+        near = exponential*_polynomial(_HART_P, x)/_polynomial(_HART_Q, x)
+        continued = x + .65
+        for k in (4, 3, 2, 1):
+            continued = x + k/continued
+        far = exponential/continued/SQRT_2PI
+    return np.where(x < 7.07106781186547, near, far)
+
+
+def pdf(x):
+    if _is_scalar(x):
+        return math.exp(-.5*x*x)/SQRT_2PI
+    x = np.asarray(x, dtype=float)
+    return np.exp(-.5*x*x)/SQRT_2PI
+
+
+def cdf(x):
+    if _is_scalar(x):
+        return .5*math.erfc(-x/SQRT_2)
+    x = np.asarray(x, dtype=float)
+    tail = _lower_tail(x)
+    return np.where(x > 0, 1 - tail, tail)
+
+
+def ppf(p):
+    if _is_scalar(p):
+        if not 0 < p < 1:
+            return -math.inf if p == 0 else math.inf if p == 1 else math.nan
+        q = min(p, 1 - p)
+        if q < _P_LOW:
+            t = math.sqrt(-2*math.log(q))
+            x = _polynomial(_C, t)/_polynomial(_D, t)
+        else:
+            t = q - .5
+            x = t*_polynomial(_A, t*t)/_polynomial(_B, t*t)
+        e = .5*math.erfc(-x/SQRT_2) - q
+        u = e*SQRT_2PI*math.exp(.5*x*x)
+        x -= u/(1 + .5*x*u)
+        return x if p <= .5 else -x
+    p = np.asarray(p, dtype=float)
+    # work in the lower tail, the upper tail follows by symmetry
+    q = np.minimum(p, 1 - p)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        t = np.sqrt(-2*np.log(q))
+        tail = _polynomial(_C, t)/_polynomial(_D, t)
+        t = q - .5
+        central = t*_polynomial(_A, t*t)/_polynomial(_B, t*t)
+        x = np.where(q < _P_LOW, tail, central)
+        e = _lower_tail(x) - q
+        u = e*SQRT_2PI*np.exp(.5*x*x)
+        x = x - u/(1 + .5*x*u)
+    x = np.where(q == 0, -np.inf, x)
+    x = np.where((p < 0) | (p > 1) | np.isnan(p), np.nan, x)
+    return np.where(p <= .5, x, -x)
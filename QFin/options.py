@@ -1,9 +1,77 @@
+import copy
 import math
 import numpy as np
-from scipy.stats import norm
+from . import instrumentation, normal
 
 
-class BlackScholesCall:
+# Slotted result shared by BlackScholesCall and BlackScholesPut: d1 and N(d1) are computed once with the price on
+# construction, each greek on first access, after which it is cached. d2 and the discount factor are derived on
+# demand rather than stored, which keeps a million live results small
+class _BlackScholesOption:
+
+    __slots__ = (
+        "asset_price", "asset_volatility", "strike_price", "time_to_expiration", "risk_free_rate",
+        "d1", "price", "_cdf_d1", "_pdf_d1", "_delta", "_gamma", "_vega", "_theta"
+    )
+
+    @property
+    def d2(self):
+        return self.d1 - self.asset_volatility*math.sqrt(self.time_to_expiration)
+
+    @property
+    def discount(self):
+        return math.exp(-self.risk_free_rate*self.time_to_expiration)
+
+    @property
+    def gamma(self):
+        if self._gamma is None:
+            self._gamma = self._cdf_d1/(self.asset_price*self.asset_volatility*math.sqrt(self.time_to_expiration))
+        return self._gamma
+
+    @property
+    def vega(self):
+        if self._vega is None:
+            self._vega = self.asset_price*self.pdf_d1*math.sqrt(self.time_to_expiration)
+        return self._vega
+
+    @property
+    def pdf_d1(self):
+        if self._pdf_d1 is None:
+            self._pdf_d1 = normal.pdf(self.d1)
+        return self._pdf_d1
+
+    # the option at another spot, d1 moves by the log spot ratio over the volatility to expiry and nothing else is
+    # recomputed beyond the price (used by PricingCache for incremental repricing)
+    def at_spot(self, asset_price):
+        option = object.__new__(type(self))
+        option.asset_price = asset_price
+        option.asset_volatility = self.asset_volatility
+        option.strike_price = self.strike_price
+        option.time_to_expiration = self.time_to_expiration
+        option.risk_free_rate = self.risk_free_rate
+        option.d1 = self.d1 + math.log(asset_price/self.asset_price)/(self.asset_volatility*math.sqrt(self.time_to_expiration))
+        option._cdf_d1 = normal.cdf(option.d1)
+        option._pdf_d1 = option._delta = option._gamma = option._vega = option._theta = None
+        option.price = option._price()
+        return option
+
+    def __init__(
+        self, asset_price, asset_volatility, strike_price,
+        time_to_expiration, risk_free_rate
+            ):
+        self.asset_price = asset_price
+        self.asset_volatility = asset_volatility
+        self.strike_price = strike_price
+        self.time_to_expiration = time_to_expiration
+        self.risk_free_rate = risk_free_rate
+        self.d1 = (math.log(asset_price/strike_price) + .5*asset_volatility*asset_volatility*time_to_expiration)/(asset_volatility*math.sqrt(time_to_expiration))
+        self._cdf_d1 = normal.cdf(self.d1)
+        self._pdf_d1 = self._delta = self._gamma = self._vega = self._theta = None
+
+
+class BlackScholesCall(_BlackScholesOption):
+
+    __slots__ = ()
 
     def call_delta(
         self, asset_price, asset_volatility, strike_price,
@@ -12,7 +80,7 @@ class BlackScholesCall:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         return z1
 
     def call_gamma(
@@ -22,7 +90,7 @@ class BlackScholesCall:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         z2 = z1/(asset_price*asset_volatility*math.sqrt(time_to_expiration))
         return z2
 
@@ -33,7 +101,7 @@ class BlackScholesCall:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.pdf(x1)
+        z1 = normal.pdf(x1)
         z2 = asset_price*z1*math.sqrt(time_to_expiration)
         return z2
 
@@ -43,8 +111,8 @@ class BlackScholesCall:
             ):
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        n1 = -((asset_price*asset_volatility*norm.pdf(x1))/(2*math.sqrt(time_to_expiration)))
-        n2 = -(risk_free_rate*strike_price*math.exp(-risk_free_rate*time_to_expiration)*norm.cdf((x1 - (asset_volatility*math.sqrt(time_to_expiration)))))
+        n1 = -((asset_price*asset_volatility*normal.pdf(x1))/(2*math.sqrt(time_to_expiration)))
+        n2 = -(risk_free_rate*strike_price*math.exp(-risk_free_rate*time_to_expiration)*normal.cdf((x1 - (asset_volatility*math.sqrt(time_to_expiration)))))
         return (n1 + n2)
 
     def call_price(
@@ -54,31 +122,43 @@ class BlackScholesCall:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         z1 = z1*asset_price
         x2 = math.log(asset_price/(strike_price)) - .5*(asset_volatility*asset_volatility)*time_to_expiration
         x2 = x2/(asset_volatility*(time_to_expiration**.5))
-        z2 = norm.cdf(x2)
+        z2 = normal.cdf(x2)
         z2 = b*strike_price*z2
         return z1 - z2
 
+    @property
+    def delta(self):
+        if self._delta is None:
+            self._delta = self._cdf_d1
+        return self._delta
+
+    @property
+    def theta(self):
+        if self._theta is None:
+            self._theta = (
+                -self.asset_price*self.asset_volatility*self.pdf_d1/(2*math.sqrt(self.time_to_expiration))
+                - self.risk_free_rate*self.strike_price*self.discount*normal.cdf(self.d2)
+            )
+        return self._theta
+
     def __init__(
         self, asset_price, asset_volatility, strike_price,
         time_to_expiration, risk_free_rate
             ):
-        self.asset_price = asset_price
-        self.asset_volatility = asset_volatility
-        self.strike_price = strike_price
-        self.time_to_expiration = time_to_expiration
-        self.risk_free_rate = risk_free_rate
-        self.price = self.call_price(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.delta = self.call_delta(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.gamma = self.call_gamma(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.vega = self.call_vega(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.theta = self.call_theta(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
+        super().__init__(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
+        self.price = self._price()
 
+    def _price(self):
+        return self.asset_price*self._cdf_d1 - self.discount*self.strike_price*normal.cdf(self.d2)
 
-class BlackScholesPut:
+
+class BlackScholesPut(_BlackScholesOption):
+
+    __slots__ = ()
 
     def put_delta(
         self, asset_price, asset_volatility, strike_price,
@@ -87,7 +167,7 @@ class BlackScholesPut:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         return z1 - 1
 
     def put_gamma(
@@ -97,7 +177,7 @@ class BlackScholesPut:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         z2 = z1/(asset_price*asset_volatility*math.sqrt(time_to_expiration))
         return z2
 
@@ -108,7 +188,7 @@ class BlackScholesPut:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.pdf(x1)
+        z1 = normal.pdf(x1)
         z2 = asset_price*z1*math.sqrt(time_to_expiration)
         return z2
 
@@ -118,8 +198,8 @@ class BlackScholesPut:
             ):
         x1 = math.log(asset_price/(strike_price)) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        n1 = -((asset_price*asset_volatility*norm.pdf(x1))/(2*math.sqrt(time_to_expiration)))
-        n2 = (risk_free_rate*strike_price*math.exp(-risk_free_rate*time_to_expiration)*norm.cdf(-(x1 - (asset_volatility*math.sqrt(time_to_expiration)))))
+        n1 = -((asset_price*asset_volatility*normal.pdf(x1))/(2*math.sqrt(time_to_expiration)))
+        n2 = (risk_free_rate*strike_price*math.exp(-risk_free_rate*time_to_expiration)*normal.cdf(-(x1 - (asset_volatility*math.sqrt(time_to_expiration)))))
         return (n1 + n2)
 
     def put_price(
@@ -129,25 +209,256 @@ class BlackScholesPut:
         b = math.exp(-risk_free_rate*time_to_expiration)
         x1 = math.log((asset_price)/strike_price) + .5*(asset_volatility*asset_volatility)*time_to_expiration
         x1 = x1/(asset_volatility*(time_to_expiration**.5))
-        z1 = norm.cdf(x1)
+        z1 = normal.cdf(x1)
         z1 = b*strike_price*z1
         x2 = math.log((asset_price)/strike_price) - .5*(asset_volatility*asset_volatility)*time_to_expiration
         x2 = x2/(asset_volatility*(time_to_expiration**.5))
-        z2 = norm.cdf(x2)
+        z2 = normal.cdf(x2)
         z2 = asset_price*z2
         return z1 - z2
 
+    @property
+    def delta(self):
+        if self._delta is None:
+            self._delta = self._cdf_d1 - 1
+        return self._delta
+
+    @property
+    def theta(self):
+        if self._theta is None:
+            self._theta = (
+                -self.asset_price*self.asset_volatility*self.pdf_d1/(2*math.sqrt(self.time_to_expiration))
+                + self.risk_free_rate*self.strike_price*self.discount*normal.cdf(-self.d2)
+            )
+        return self._theta
+
     def __init__(
         self, asset_price, asset_volatility, strike_price,
         time_to_expiration, risk_free_rate
             ):
+        super().__init__(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
+        self.price = self._price()
+
+    def _price(self):
+        return self.discount*self.strike_price*self._cdf_d1 - self.asset_price*normal.cdf(self.d2)
+
+
+# Vectorized Black-Scholes pricer for whole option chains, inputs broadcast against each other
+# d1/d2 are computed once per contract and price and greeks are stored as arrays
+class BlackScholesChain:
+
+    def __init__(
+        self, asset_price, asset_volatility, strike_price,
+        time_to_expiration, risk_free_rate, op_type="CALL"
+            ):
+        S, sigma, K, T, r = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate))
+        )
+        self.asset_price = S
+        self.asset_volatility = sigma
+        self.strike_price = K
+        self.time_to_expiration = T
+        self.risk_free_rate = r
+        self.is_call = np.broadcast_to(np.asarray(op_type) == "CALL", S.shape)
+        # spot independent terms, kept so at_spot can reprice the chain when only the spot moves
+        self.sqrt_t = np.sqrt(T)
+        self.vol_sqrt_t = sigma*self.sqrt_t
+        self.discounted_strike = np.exp(-r*T)*K
+        self.log_strike_drift = np.log(K) - (r + .5*sigma*sigma)*T
+        self.evaluate(S)
+
+    # Price and greeks at spot S from the spot independent terms
+    def evaluate(self, S):
+        with instrumentation.stage("black_scholes"):
+            self._evaluate(S)
+        instrumentation.count("options", self.is_call.size)
+
+    def _evaluate(self, S):
+        sigma, r = self.asset_volatility, self.risk_free_rate
+        # +1 for calls and -1 for puts lets both share the same expressions
+        sign = np.where(self.is_call, 1., -1.)
+        self.asset_price = S
+        self.d1 = (np.log(S) - self.log_strike_drift)/self.vol_sqrt_t
+        self.d2 = self.d1 - self.vol_sqrt_t
+        pdf_d1 = normal.pdf(self.d1)
+        cdf_d1 = normal.cdf(sign*self.d1)
+        cdf_d2 = normal.cdf(sign*self.d2)
+        self.price = sign*(S*cdf_d1 - self.discounted_strike*cdf_d2)
+        self.delta = sign*cdf_d1
+        self.gamma = pdf_d1/(S*self.vol_sqrt_t)
+        self.vega = S*pdf_d1*self.sqrt_t
+        self.theta = -(S*sigma*pdf_d1)/(2*self.sqrt_t) - sign*r*self.discounted_strike*cdf_d2
+
+    # The chain at another spot, reusing the expiry, strike and rate terms of this one
+    def at_spot(self, asset_price):
+        chain = copy.copy(self)
+        chain.evaluate(np.broadcast_to(np.asarray(asset_price, dtype=float), self.is_call.shape))
+        return chain
+
+
+# Vectorized implied volatility for whole arrays of option quotes
+# Corrado-Miller initial guess followed by safeguarded Halley iterations on the BlackScholesChain vega,
+# converged quotes are masked off and failures are reported per element in status instead of raising.
+# A quote converges once its price is within tol and its volatility within vol_tol, a quote whose price is matched
+# by a whole range of volatilities (too little vega to pin one down) is reported LOW_VEGA with its last iterate
+class BlackScholesImpliedVolatility:
+
+    CONVERGED = 0
+    NOT_CONVERGED = 1
+    BELOW_INTRINSIC = 2
+    ABOVE_UPPER_BOUND = 3
+    INVALID_INPUT = 4
+    LOW_VEGA = 5
+
+    def initial_guess(self, call_price, asset_price, discounted_strike, time_to_expiration):
+        # Corrado-Miller rational approximation, negative discriminants fall back to Brenner-Subrahmanyam
+        m = asset_price - discounted_strike
+        c = call_price - .5*m
+        discriminant = np.maximum(c*c - m*m/np.pi, 0)
+        guess = np.sqrt(2*np.pi)/(asset_price + discounted_strike)*(c + np.sqrt(discriminant))
+        return np.clip(guess/np.sqrt(time_to_expiration), .01, 5)
+
+    def __init__(
+        self, option_price, asset_price, strike_price,
+        time_to_expiration, risk_free_rate, op_type="CALL", tol=1e-10, max_iterations=50, vol_tol=1e-8
+            ):
+        P, S, K, T, r = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (option_price, asset_price, strike_price, time_to_expiration, risk_free_rate))
+        )
+        is_call = np.broadcast_to(np.asarray(op_type) == "CALL", P.shape)
+        Kb = K*np.exp(-r*T)
+        # work entirely with calls, puts are mapped through put-call parity
+        C = np.where(is_call, P, P + S - Kb)
+
+        self.volatility = np.full(P.shape, np.nan)
+        self.status = np.full(P.shape, self.NOT_CONVERGED)
+        self.iterations = np.zeros(P.shape, dtype=int)
+
+        with np.errstate(invalid="ignore"):
+            invalid = ~((S > 0) & (K > 0) & (T > 0) & np.isfinite(C))
+            below = ~invalid & (C <= np.maximum(S - Kb, 0))
+            above = ~invalid & (C >= S)
+        self.status[invalid] = self.INVALID_INPUT
+        self.status[below] = self.BELOW_INTRINSIC
+        self.status[above] = self.ABOVE_UPPER_BOUND
+
+        active = np.flatnonzero(~(invalid | below | above))
+        with instrumentation.stage("implied_volatility"):
+            self._iterate(active, S, K, T, r, C, Kb, tol, vol_tol, max_iterations)
+
+    # Halley iterations on the quotes still active, results are written into volatility, status and iterations
+    def _iterate(self, active, S, K, T, r, C, Kb, tol, vol_tol, max_iterations):
+        S, K, T, r, C = (x.ravel()[active] for x in (S, K, T, r, C))
+        sigma = self.initial_guess(C, S, Kb.ravel()[active], T)
+        lower = np.zeros_like(sigma)
+        upper = np.full_like(sigma, 10.)
+        f = np.full_like(sigma, np.inf)
+        volatility = self.volatility.reshape(-1)
+        status = self.status.reshape(-1)
+        iterations = self.iterations.reshape(-1)
+
+        for i in range(max_iterations):
+            if active.size == 0:
+                break
+            instrumentation.count("implied_volatility_iterations")
+            chain = BlackScholesChain(S, sigma, K, T, r)
+            f = chain.price - C
+            volga = chain.vega*chain.d1*chain.d2/sigma
+            # keep a bracket on the root so a bad Halley step falls back to bisection
+            upper = np.where(f > 0, sigma, upper)
+            lower = np.where(f < 0, sigma, lower)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                step = 2*f*chain.vega/(2*chain.vega*chain.vega - f*volga)
+            # the price test alone stops low vega quotes anywhere in the range of volatilities that match it, and
+            # the volatility is only resolved if rounding the price (of order eps*S*delta) moves it less than vol_tol
+            resolved = np.finfo(float).eps*S*chain.delta <= vol_tol*chain.vega
+            done = (np.abs(f) <= tol) & ((np.abs(step) <= vol_tol) | (upper - lower <= vol_tol)) & resolved
+            volatility[active[done]] = sigma[done]
+            status[active[done]] = self.CONVERGED
+            iterations[active] = i + 1
+            keep = ~done
+            active, S, K, T, r, C, sigma, f, lower, upper, step = (
+                x[keep] for x in (active, S, K, T, r, C, sigma, f, lower, upper, step)
+            )
+            sigma_next = sigma - step
+            outside = ~((sigma_next > lower) & (sigma_next < upper))
+            sigma = np.where(outside, .5*(lower + upper), sigma_next)
+
+        # quotes still active here did not converge, report their last iterate
+        volatility[active] = sigma
+        status[active[np.abs(f) <= tol]] = self.LOW_VEGA
+
+
+# Closed-form price of a discretely monitored geometric-average Asian option
+# the log of the geometric average is normal, fixing_times are measured from today and the payoff is paid at the last fixing
+# drift defaults to the risk free rate (risk neutral) and may be set to price under a real-world drift
+# average is the geometric average of past_fixings fixings already made, fixing_times are then the remaining ones
+class GeometricAsianOption:
+
+    def __init__(
+        self, asset_price, asset_volatility, strike_price,
+        fixing_times, risk_free_rate, op_type="CALL", drift=None, average=None, past_fixings=0
+            ):
+        t = np.sort(np.asarray(fixing_times, dtype=float))
+        N = len(t)
+        drift = risk_free_rate if drift is None else drift
+        past = past_fixings if average is not None else 0
         self.asset_price = asset_price
         self.asset_volatility = asset_volatility
         self.strike_price = strike_price
-        self.time_to_expiration = time_to_expiration
+        self.fixing_times = t
+        self.risk_free_rate = risk_free_rate
+        # mean and variance of the log geometric average, sum over i, j of min(t_i, t_j) in closed form
+        self.mean = np.log(asset_price) + (drift - .5*asset_volatility*asset_volatility)*np.average(t)
+        if past:
+            self.mean = (past*np.log(average) + N*self.mean)/(N + past)
+        self.variance = asset_volatility*asset_volatility*np.sum(t*(2*(N - np.arange(N)) - 1))/((N + past)*(N + past))
+        sign = np.where(np.asarray(op_type) == "CALL", 1., -1.)
+        vol = np.sqrt(self.variance)
+        d2 = (self.mean - np.log(strike_price))/vol
+        d1 = d2 + vol
+        forward = np.exp(self.mean + .5*self.variance)
+        self.price = sign*np.exp(-risk_free_rate*t[-1])*(forward*normal.cdf(sign*d1) - strike_price*normal.cdf(sign*d2))
+
+
+# Turnbull-Wakeman approximation of a discretely monitored arithmetic-average Asian option, the average of the
+# remaining fixings is taken as lognormal with its exact first two moments and priced in closed form (within a few
+# basis points of Monte Carlo for usual volatilities, strikes and fixing counts). Arguments are those of
+# GeometricAsianOption with average the arithmetic average of the past fixings, which lowers the strike the
+# remaining fixings have to beat. Once it is beaten for sure a call is worth its discounted forward intrinsic value
+class TurnbullWakemanAsianOption:
+
+    def __init__(
+        self, asset_price, asset_volatility, strike_price,
+        fixing_times, risk_free_rate, op_type="CALL", drift=None, average=None, past_fixings=0
+            ):
+        t = np.sort(np.asarray(fixing_times, dtype=float))
+        N = len(t)
+        drift = risk_free_rate if drift is None else drift
+        past = past_fixings if average is not None else 0
+        self.asset_price = asset_price
+        self.asset_volatility = asset_volatility
+        self.strike_price = strike_price
+        self.fixing_times = t
         self.risk_free_rate = risk_free_rate
-        self.price = self.put_price(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.delta = self.put_delta(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.gamma = self.put_gamma(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.vega = self.put_vega(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
-        self.theta = self.put_theta(asset_price, asset_volatility, strike_price, time_to_expiration, risk_free_rate)
+        # share of the remaining fixings in the average and the strike their own average has to beat
+        self.weight = N/(N + past)
+        strike = np.asarray(strike_price, dtype=float)
+        if past:
+            strike = ((N + past)*strike - past*average)/N
+        forwards = asset_price*np.exp(drift*t)
+        # first two moments of the average of the remaining fixings, E[S_i S_j] = F_i F_j exp(sigma^2 min(t_i, t_j))
+        # summed in O(N) over the sorted times through the forwards of the later fixings
+        later = np.cumsum(forwards[::-1])[::-1]
+        self.mean = np.average(forwards)
+        second = np.sum(forwards*np.exp(asset_volatility*asset_volatility*t)*(2*later - forwards))/(N*N)
+        self.variance = np.log(second/(self.mean*self.mean))
+        sign = np.where(np.asarray(op_type) == "CALL", 1., -1.)
+        vol = np.sqrt(self.variance)
+        beaten = strike <= 0
+        d1 = (np.log(self.mean/np.where(beaten, 1., strike)) + .5*self.variance)/vol
+        d2 = d1 - vol
+        discount = self.weight*np.exp(-risk_free_rate*t[-1])
+        price = sign*discount*(self.mean*normal.cdf(sign*d1) - strike*normal.cdf(sign*d2))
+        # [()] gives a scalar back for scalar inputs
+        self.price = np.where(beaten, np.where(sign > 0, discount*(self.mean - strike), 0.), price)[()]
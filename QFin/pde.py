@@ -0,0 +1,256 @@
+import copy
+import numpy as np
+from . import instrumentation
+
+# Width of the log spot grid either side of the spot and strike, in standard deviations of the log price at expiry
+STANDARD_DEVIATIONS = 5
+# Penalty weight enforcing early exercise, large enough that the value sits on the exercise boundary to rounding
+PENALTY = 1e8
+# Penalty iterations per time step, the exercised set settles in two or three
+MAX_PENALTY_ITERATIONS = 20
+
+
+# Grid average of the payoff over each cell [x - h/2, x + h/2] of the log spot grid, so the kink at the strike is
+# integrated instead of sampled (the main source of Crank-Nicolson error, with the Rannacher start)
+def _cell_average_payoff(x, h, strike, call):
+    k = np.log(strike)
+    if call:
+        lo, hi = np.maximum(x - .5*h, k), x + .5*h
+        return np.where(hi > lo, (np.exp(hi) - np.exp(lo) - strike*(hi - lo))/h, 0.)
+    lo, hi = x - .5*h, np.minimum(x + .5*h, k)
+    return np.where(hi > lo, (strike*(hi - lo) - np.exp(hi) + np.exp(lo))/h, 0.)
+
+
+# Value, first and second log spot derivative at x from the quadratic through the three nearest grid points, NaN
+# off the grid where the quadratic would only extrapolate
+def _quadratic(x, lower, h, values):
+    u = (np.asarray(x, dtype=float) - lower)/h
+    outside = ~((u >= -1e-9) & (u <= len(values) - 1 + 1e-9))
+    i = np.clip(np.rint(np.where(outside, 0, u)).astype(int), 1, len(values) - 2)
+    u -= i
+    first = .5*(values[i + 1] - values[i - 1])
+    second = values[i + 1] - 2*values[i] + values[i - 1]
+    value, first, second = values[i] + u*first + .5*u*u*second, (first + u*second)/h, second/(h*h)
+    return np.where(outside, np.nan, value), np.where(outside, np.nan, first), np.where(outside, np.nan, second)
+
+
+# Crank-Nicolson finite difference pricer of the Black-Scholes equation on a uniform log spot grid, one tridiagonal
+# (LAPACK gtsv) solve per time step values the option at every spot of the grid at once. The first time steps
+# after expiry and after every discrete monitoring date are split into fully implicit half steps (Rannacher) so the
+# payoff kink does not ring through gamma. Barriers are boundary conditions: knocked grid points hold the rebate
+# (paid at expiry) for knock-out options and the vanilla value for knock-in options, solved alongside on the same
+# grid, continuously or on the monitoring dates of an array of times. American exercise is enforced by penalty
+# iteration. price, delta, gamma and theta (per year) are read off the grid at the spot, at_spot reads them at others
+class _CrankNicolsonOption:
+
+    call = True
+
+    # Solves the theta scheme step (I - theta dt L) V = rhs with V fixed to values where fixed is set and, with
+    # exercise values, kept above them by penalty iteration
+    def _solve(self, theta, dt, rhs, fixed, values, exercise=None):
+        # SciPy is only loaded when a finite difference pricer is used
+        from scipy.linalg.lapack import dgtsv
+        a, b, c = self.operator
+        lower = np.where(fixed[1:], 0., -theta*dt*a[1:])
+        diagonal = np.where(fixed, 1., 1 - theta*dt*b)
+        upper = np.where(fixed[:-1], 0., -theta*dt*c[:-1])
+        rhs = np.where(fixed, values, rhs)
+        instrumentation.count("pde_solves")
+        solution = dgtsv(lower, diagonal, upper, rhs)[3]
+        if exercise is None:
+            return solution
+        exercised = np.zeros(len(rhs), dtype=bool)
+        for _ in range(MAX_PENALTY_ITERATIONS):
+            active = (solution < exercise) & ~fixed
+            if np.array_equal(active, exercised):
+                break
+            exercised = active
+            instrumentation.count("pde_solves")
+            solution = dgtsv(lower, diagonal + PENALTY*exercised, upper, rhs + PENALTY*exercised*exercise)[3]
+        return solution
+
+    # L V at every interior grid point (boundary rows are fixed)
+    def _apply(self, values):
+        a, b, c = self.operator
+        applied = b*values
+        applied[1:] += a[1:]*values[:-1]
+        applied[:-1] += c[:-1]*values[1:]
+        return applied
+
+    def _step(self, values, theta, dt, fixed, boundary, exercise):
+        rhs = values + (1 - theta)*dt*self._apply(values)
+        return self._solve(theta, dt, rhs, fixed, boundary, exercise)
+
+    # Vanilla value at the grid edges tau before expiry, the discounted forward intrinsic value on the side the
+    # option finishes in the money and nothing on the other (the early exercise value when it is larger)
+    def _edge_values(self, tau):
+        discount = np.exp(-self.risk_free_rate*tau)
+        if self.call:
+            edges = np.maximum(self.spots[[0, -1]] - self.strike_price*discount, 0)
+        else:
+            edges = np.maximum(self.strike_price*discount - self.spots[[0, -1]], 0)
+        if self.exercise == "american":
+            edges = np.maximum(edges, self.intrinsic[[0, -1]])
+        return edges
+
+    def _grid(self, spot_steps):
+        x0 = np.log(self.asset_price)
+        k = np.log(self.strike_price)
+        width = STANDARD_DEVIATIONS*self.asset_volatility*np.sqrt(self.time_to_expiration)
+        lower, upper = min(x0, k) - width, max(x0, k) + width
+        h = (upper - lower)/spot_steps
+        # the barrier (or else the spot) sits on a grid point
+        anchor = x0 if self.barrier is None else np.log(self.barrier)
+        if self.barrier is not None and isinstance(self.monitoring, str) and self.out:
+            # nothing beyond a continuously monitored knock-out barrier matters
+            if self.up:
+                upper = anchor
+            else:
+                lower = anchor
+        lower = anchor - np.ceil((anchor - lower)/h - 1e-9)*h
+        upper = anchor + np.ceil((upper - anchor)/h - 1e-9)*h
+        if self.barrier is not None and not isinstance(self.monitoring, str):
+            # a barrier applied on dates leaves a jump, which is resolved best half way between grid points
+            lower, upper = lower - .5*h, upper + .5*h
+        return lower, h, int(np.rint((upper - lower)/h)) + 1
+
+    # calendar times of the steps from expiry back to today, dates given fall on step ends
+    def _times(self, time_steps, dates):
+        T = self.time_to_expiration
+        times = np.concatenate((np.linspace(0, T, time_steps + 1), np.clip(dates, 0, T)))
+        return np.unique(np.round(times, 12))[::-1]
+
+    def _solve_grid(self, spot_steps, time_steps, rannacher_steps):
+        with instrumentation.stage("pde"):
+            sigma, r, T = self.asset_volatility, self.risk_free_rate, self.time_to_expiration
+            self.lower, self.h, points = self._grid(spot_steps)
+            x = self.lower + self.h*np.arange(points)
+            self.spots = np.exp(x)
+            # generator of the Black-Scholes equation in log spot, V_tau = a V_(i-1) + b V_i + c V_(i+1)
+            diffusion, drift = .5*sigma*sigma/(self.h*self.h), (r - .5*sigma*sigma)/(2*self.h)
+            self.operator = (np.full(points, diffusion - drift), np.full(points, -2*diffusion - r), np.full(points, diffusion + drift))
+            self.intrinsic = np.maximum(self.spots - self.strike_price if self.call else self.strike_price - self.spots, 0)
+            exercise = self.intrinsic if self.exercise == "american" else None
+            vanilla = _cell_average_payoff(x, self.h, self.strike_price, self.call)
+            edges = np.zeros(points, dtype=bool)
+            edges[[0, -1]] = True
+            dates = []
+            if self.barrier is None:
+                knocked = np.zeros(points, dtype=bool)
+            else:
+                knocked = self.spots >= self.barrier*(1 - 1e-12) if self.up else self.spots <= self.barrier*(1 + 1e-12)
+                if not isinstance(self.monitoring, str):
+                    dates = np.asarray(self.monitoring, dtype=float)
+            continuous = self.barrier is not None and isinstance(self.monitoring, str)
+            times = self._times(time_steps, dates)
+            monitored = set(np.round(np.clip(dates, 0, T), 12))
+
+            # knocked value tau before expiry, the vanilla solution for knock-in options
+            def knocked_values(tau, vanilla):
+                return np.full(points, self.rebate*np.exp(-r*tau)) if self.out else vanilla
+
+            values = vanilla.copy()
+            if self.barrier is not None and not self.out:
+                # not knocked in: the rebate unless the barrier is crossed at expiry
+                values = np.full(points, float(self.rebate))
+            if continuous or round(T, 12) in monitored:
+                values = np.where(knocked, knocked_values(0., vanilla), values)
+            restart = rannacher_steps
+            for t, t_next in zip(times[1:], times[:-1]):
+                tau, dt = T - t, t_next - t
+                if restart:
+                    substeps, theta, restart = 2, 1., restart - 1
+                else:
+                    substeps, theta = 1, .5
+                for substep in range(substeps):
+                    sub_tau = tau - (substeps - substep - 1)*dt/substeps
+                    edge_values = np.zeros(points)
+                    edge_values[[0, -1]] = self._edge_values(sub_tau)
+                    if self.barrier is not None and not self.out:
+                        vanilla = self._step(vanilla, theta, dt/substeps, edges, edge_values, exercise)
+                    if self.barrier is None:
+                        values = self._step(values, theta, dt/substeps, edges, edge_values, exercise)
+                        continue
+                    boundary = knocked_values(sub_tau, vanilla)
+                    if self.out:
+                        # the edge away from the barrier is vanilla, the one past it knocked
+                        boundary = np.where(knocked, boundary, edge_values)
+                    else:
+                        # never knocked in below (above) the grid, the rebate is paid
+                        boundary = np.where(knocked, boundary, self.rebate*np.exp(-r*sub_tau))
+                    fixed = edges | knocked if continuous else edges
+                    values = self._step(values, theta, dt/substeps, fixed, boundary, exercise if self.out else None)
+                if round(t, 12) in monitored and t > 0:
+                    values = np.where(knocked, knocked_values(tau, vanilla), values)
+                    # the barrier leaves a jump for the next steps to smooth
+                    restart = rannacher_steps
+            self.values = values
+
+    # copy of the result with price and greeks at another spot of the grid (an array of spots works too), spots off
+    # the grid read NaN, PricingCache uses it for incremental repricing and solves afresh for those
+    def at_spot(self, asset_price):
+        result = copy.copy(self)
+        result.asset_price = asset_price
+        result._read(asset_price)
+        return result
+
+    def _read(self, asset_price):
+        asset_price = np.asarray(asset_price, dtype=float)
+        value, first, second = _quadratic(np.log(asset_price), self.lower, self.h, self.values)
+        sigma, r = self.asset_volatility, self.risk_free_rate
+        # theta from the equation itself, nothing is earned by waiting where an American option is exercised
+        theta = -(.5*sigma*sigma*second + (r - .5*sigma*sigma)*first - r*value)
+        if self.exercise == "american":
+            nearest = np.clip(np.rint((np.log(asset_price) - self.lower)/self.h).astype(int), 0, len(self.values) - 1)
+            exercised = self.values[nearest] <= self.intrinsic[nearest] + 1e-6*self.strike_price
+            theta = np.where(exercised, 0., theta)
+        if self.barrier is not None and self.out and isinstance(self.monitoring, str):
+            # the grid ends at a continuously monitored knock-out barrier, spots at or past it are knocked out and
+            # worth the rebate paid at expiry
+            knocked = asset_price >= self.barrier if self.up else asset_price <= self.barrier
+            rebate = self.rebate*np.exp(-r*self.time_to_expiration)
+            value = np.where(knocked, rebate, value)
+            first = np.where(knocked, 0., first)
+            second = np.where(knocked, 0., second)
+            theta = np.where(knocked, r*rebate, theta)
+        # [()] gives scalars back for a scalar spot
+        self.price = value[()]
+        self.delta = (first/asset_price)[()]
+        self.gamma = ((second - first)/(asset_price*asset_price))[()]
+        self.theta = np.asarray(theta)[()]
+
+    # barrier: None for a vanilla option, up/out: barrier direction and type as for MonteCarloBarrierCall, rebate: paid
+    # at expiry if knocked out (or never knocked in), monitoring: "continuous" or an array of monitoring times,
+    # exercise: "european" or "american", spot_steps/time_steps: grid size, rannacher_steps: implicit start steps
+    def __init__(
+        self, asset_price, asset_volatility, strike_price,
+        time_to_expiration, risk_free_rate, barrier=None, up=True, out=True, rebate=0,
+        monitoring="continuous", exercise="european", spot_steps=400, time_steps=200, rannacher_steps=2
+            ):
+        if exercise not in ("european", "american"):
+            raise ValueError("Exercise must be european or american")
+        if isinstance(monitoring, str) and monitoring != "continuous":
+            raise ValueError("Monitoring must be continuous or an array of monitoring times")
+        self.asset_price = asset_price
+        self.asset_volatility = asset_volatility
+        self.strike_price = strike_price
+        self.time_to_expiration = time_to_expiration
+        self.risk_free_rate = risk_free_rate
+        self.barrier = barrier
+        self.up = up
+        self.out = out
+        self.rebate = rebate
+        self.monitoring = monitoring
+        self.exercise = exercise
+        self._solve_grid(spot_steps, time_steps, rannacher_steps)
+        self._read(asset_price)
+
+
+class CrankNicolsonCall(_CrankNicolsonOption):
+
+    call = True
+
+
+class CrankNicolsonPut(_CrankNicolsonOption):
+
+    call = False
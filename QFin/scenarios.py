@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from .simulations import GeometricBrownianMotion, StochasticVarianceModel, _time_steps
+
+# Bytes hashed per read when checksumming a scenario file
+CHECKSUM_BLOCK = 1 << 24
+
+
+def _checksum(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# A stored set of simulated paths opened read-only and memory-mapped: paths (and variances for the stochastic
+# variance model) are (n, steps) arrays on times stored time-major (Fortran order), so each time column is one
+# contiguous run of the file and at_times reads only the columns it asks for. Pages are only read from disk when
+# touched and every process opening the file shares the page cache
+class Scenario:
+
+    # columns of the grid points at or just after the requested times, as (n, len(times)) array
+    def at_times(self, times, variance=False):
+        index = np.searchsorted(self.times, np.asarray(times, dtype=float) - 1e-9)
+        index = np.minimum(index, len(self.times) - 1)
+        return (self.variances if variance else self.paths)[:, index]
+
+    def verify(self):
+        for filename, checksum in zip(self.filenames, self.metadata["checksums"]):
+            if _checksum(filename) != checksum:
+                raise ValueError("Scenario file " + filename + " does not match its checksum")
+        return True
+
+    def __init__(self, metadata, filenames):
+        self.metadata = metadata
+        self.filenames = filenames
+        self.key = metadata["key"]
+        self.times = np.cumsum(_time_steps(metadata["dt"], metadata["T"]))
+        self.paths = np.load(filenames[0], mmap_mode="r")
+        self.variances = np.load(filenames[1], mmap_mode="r") if len(filenames) > 1 else None
+        self.forward = metadata["forward"]
+
+
+# Directory of simulated path matrices shared between pricing jobs and processes. Scenarios are keyed by a hash of
+# the model, its parameters, the time grid, n, seed, bit generator and sampling options, so every job asking for the
+# same scenario of the day opens the same files. Paths are written chunk by chunk straight into a .npy memmap (chunk
+# i draws from stream i of SeedSequence(seed) as MonteCarloParallel does), so a scenario never has to fit in memory.
+# Files are written under a temporary name and renamed into place with their metadata (model, parameters, shape,
+# sha256 checksums) written last, readers never see a partial scenario. max_bytes bounds the size of the store,
+# the least recently opened scenarios are evicted once it is exceeded
+class ScenarioStore:
+
+    MODELS = ("gbm", "svm")
+
+    def key(self, model, params, dt, T, n, seed, generator="PCG64", **kwargs):
+        description = json.dumps([model, list(params), dt, T, n, seed, generator, sorted(kwargs.items())], default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+    def _filenames(self, key, model):
+        names = [os.path.join(self.directory, key + ".npy")]
+        if model == "svm":
+            names.append(os.path.join(self.directory, key + ".variance.npy"))
+        return names
+
+    def _metadata_filename(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    # params: (S, mu, sigma) for "gbm", (S, mu, r, div, alpha, beta, rho, vol_var, inst_var) for "svm", kwargs are
+    # passed on to the engine (exact, variance_fix, variance_reduction, sampling, replications)
+    def get(self, model, params, dt, T, n, seed, generator="PCG64", **kwargs):
+        if model not in self.MODELS:
+            raise ValueError("Model must be one of " + ", ".join(self.MODELS))
+        key = self.key(model, params, dt, T, n, seed, generator, **kwargs)
+        if not os.path.exists(self._metadata_filename(key)):
+            self._write(key, model, params, dt, T, n, seed, generator, kwargs)
+        return self.open(key)
+
+    def gbm(self, S, mu, sigma, dt, T, n, seed, generator="PCG64", **kwargs):
+        return self.get("gbm", (S, mu, sigma), dt, T, n, seed, generator, **kwargs)
+
+    def svm(self, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, seed, generator="PCG64", **kwargs):
+        return self.get("svm", (S, mu, r, div, alpha, beta, rho, vol_var, inst_var), dt, T, n, seed, generator, **kwargs)
+
+    def open(self, key, verify=False):
+        filename = self._metadata_filename(key)
+        with open(filename) as f:
+            metadata = json.load(f)
+        # the access time of the metadata orders eviction
+        os.utime(filename)
+        scenario = Scenario(metadata, self._filenames(key, metadata["model"]))
+        if verify:
+            scenario.verify()
+        return scenario
+
+    def _write(self, key, model, params, dt, T, n, seed, generator, kwargs):
+        steps = len(_time_steps(dt, T))
+        filenames = self._filenames(key, model)
+        metadata_filename = self._metadata_filename(key)
+        suffix = ".tmp-" + str(os.getpid())
+        try:
+            files = [np.lib.format.open_memmap(name + suffix, mode="w+", dtype=float, shape=(n, steps), fortran_order=True) for name in filenames]
+            streams = np.random.SeedSequence(seed).spawn(-(-n//self.chunk_size))
+            bit_generator = getattr(np.random, generator)
+            for i, stream in enumerate(streams):
+                start = i*self.chunk_size
+                size = min(self.chunk_size, n - start)
+                rng = np.random.Generator(bit_generator(stream))
+                # antithetic pairs and sobol replications round the path count up, the extra rows are dropped
+                if model == "gbm":
+                    files[0][start:start + size] = GeometricBrownianMotion.simulate_paths(*params, dt, T, size, rng=rng, **kwargs)[:size]
+                else:
+                    S, mu, r, div, alpha, beta, rho, vol_var, inst_var = params
+                    prices, variances = StochasticVarianceModel.simulate_paths(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, size, return_variance=True, rng=rng, **kwargs)
+                    files[0][start:start + size] = prices[:size]
+                    files[1][start:start + size] = variances[:size]
+            for array in files:
+                array.flush()
+            del files
+            for name in filenames:
+                os.replace(name + suffix, name)
+            S = params[0]
+            metadata = {
+                "key": key, "model": model, "params": list(params), "dt": dt, "T": T, "n": n, "steps": steps,
+                "seed": seed, "generator": generator, "options": {k: repr(v) for k, v in kwargs.items()},
+                # expected terminal price, the known mean of the terminal price control variate
+                "forward": S*np.exp(params[1]*T) if model == "gbm" else S*np.exp((params[2] - params[3])*T),
+                "dtype": "float64", "checksums": [_checksum(name) for name in filenames],
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "numpy": np.__version__,
+            }
+            with open(metadata_filename + suffix, "w") as f:
+                json.dump(metadata, f, indent=1)
+            os.replace(metadata_filename + suffix, metadata_filename)
+        finally:
+            # a failed write leaves no partial files behind
+            files = None
+            for name in filenames + [metadata_filename]:
+                if os.path.exists(name + suffix):
+                    os.remove(name + suffix)
+        self.evict(keep=key)
+
+    # (key, last opened, bytes) of every complete scenario in the store
+    def scenarios(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            filename = self._metadata_filename(key)
+            try:
+                with open(filename) as f:
+                    model = json.load(f)["model"]
+                size = sum(os.path.getsize(data) for data in self._filenames(key, model))
+                entries.append((key, os.path.getmtime(filename), size))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def size(self):
+        return sum(entry[2] for entry in self.scenarios())
+
+    # Removes least recently opened scenarios (other than keep) until the store fits max_bytes, processes that still
+    # have one open keep reading it (the mapping outlives the unlinked file on POSIX systems)
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return []
+        entries = sorted(self.scenarios(), key=lambda entry: entry[1])
+        total = sum(entry[2] for entry in entries)
+        evicted = []
+        for key, opened, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def remove(self, key):
+        filename = self._metadata_filename(key)
+        with open(filename) as f:
+            model = json.load(f)["model"]
+        # metadata first, the scenario stops being visible before its data goes
+        os.remove(filename)
+        for name in self._filenames(key, model):
+            if os.path.exists(name):
+                os.remove(name)
+
+    # directory: where the scenarios live, max_bytes: size bound of the store (None for unbounded), chunk_size:
+    # paths simulated and written at a time
+    def __init__(self, directory, max_bytes=None, chunk_size=65536):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
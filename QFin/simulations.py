@@ -1,5 +1,222 @@
+import os
+import threading
+import time
 import numpy as np
-from scipy.stats import norm
+from . import instrumentation, normal
+from .options import GeometricAsianOption
+
+VARIANCE_REDUCTION_MODES = ("antithetic", "moment_matching", "control_variate")
+SAMPLING_MODES = ("pseudo", "sobol")
+# Storage precision of simulated paths, float32 halves the memory traffic of the path matrices
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+# Normals drawn per block when they are stored in single precision
+NORMAL_BLOCK = 1 << 18
+GREEK_METHODS = ("pathwise", "likelihood_ratio", "bump")
+# Regression bases of the continuation value of the Longstaff-Schwartz pricers
+EXERCISE_BASES = ("polynomial", "laguerre")
+
+
+# Step sizes of the simulation time grid, the final step is shortened so the grid ends exactly at T
+def _time_steps(dt, T):
+    n_steps = max(int(np.ceil(round(T/dt, 9))), 1)
+    steps = np.full(n_steps, float(dt))
+    steps[-1] = T - dt*(n_steps - 1)
+    return steps
+
+
+# Step sizes of the smallest grid through the observation times a payoff needs (clipped to (0, T]), ending at T
+def _observation_steps(times, T):
+    t = np.unique(np.clip(np.asarray(times, dtype=float), 0, T))
+    t = t[t > 0]
+    if len(t) == 0 or t[-1] < T:
+        t = np.append(t, T)
+    return np.diff(t, prepend=0.)
+
+
+# Future fixing times of an Asian payoff, every point of the simulation grid when none are given
+def _fixing_times(fixings, dt, T):
+    if fixings is None:
+        return np.cumsum(_time_steps(dt, T))
+    fixings = np.sort(np.asarray(fixings, dtype=float).ravel())
+    if len(fixings) == 0 or fixings[0] <= 0 or fixings[-1] > T + 1e-12:
+        raise ValueError("Fixings must be a non empty array of times in (0, T]")
+    return fixings
+
+
+# Grid point of every fixing on a grid of steps, the first at or after the fixing time
+def _fixing_columns(fixings, steps):
+    index = np.searchsorted(np.cumsum(steps), np.asarray(fixings, dtype=float) - 1e-9)
+    return np.minimum(index, len(steps) - 1)
+
+
+# Normalize a variance reduction argument (None, a mode name or an iterable of mode names) to a set of modes
+def _variance_reduction_modes(variance_reduction):
+    if variance_reduction is None:
+        return frozenset()
+    if isinstance(variance_reduction, str):
+        variance_reduction = (variance_reduction,)
+    modes = frozenset(variance_reduction)
+    unknown = modes.difference(VARIANCE_REDUCTION_MODES)
+    if unknown:
+        raise ValueError("Unknown variance reduction mode: " + ", ".join(sorted(unknown)))
+    return modes
+
+
+def _precision_dtype(precision):
+    if precision not in PRECISIONS:
+        raise ValueError("Precision must be one of " + ", ".join(PRECISIONS))
+    return PRECISIONS[precision]
+
+
+# Brownian bridge construction order for a time grid: the terminal point first, then midpoints of ever finer intervals
+# each entry is (point, left, right, left weight, right weight, conditional standard deviation), index -1 is time 0
+def _brownian_bridge_plan(steps):
+    t = np.cumsum(steps)
+    m = len(t)
+    plan = [(m - 1, -1, -1, 0., 0., np.sqrt(t[-1]))]
+    intervals = [(-1, m - 1)]
+    while intervals:
+        finer = []
+        for left, right in intervals:
+            if right - left < 2:
+                continue
+            mid = (left + right)//2
+            t_left = t[left] if left >= 0 else 0.
+            span = t[right] - t_left
+            plan.append((
+                mid, left, right, (t[right] - t[mid])/span, (t[mid] - t_left)/span,
+                np.sqrt((t[mid] - t_left)*(t[right] - t[mid])/span)
+            ))
+            finer += [(left, mid), (mid, right)]
+        intervals = finer
+    return plan
+
+
+# Maps normals in importance order (last axis) to standard normal increments of a Brownian path on the grid
+def _brownian_bridge(z, steps):
+    W = np.zeros(z.shape[:-1] + (len(steps) + 1,))
+    for k, (point, left, right, a, b, c) in enumerate(_brownian_bridge_plan(steps)):
+        W[..., point + 1] = a*W[..., left + 1] + b*W[..., right + 1] + c*z[..., k]
+    return np.diff(W, axis=-1)/np.sqrt(steps)
+
+
+# Points per Sobol replication for n paths, rounded up to a power of two which keeps the balance of the sequence
+def _sobol_points(n, replications):
+    return 1 << max(-(-n//replications) - 1, 0).bit_length()
+
+
+# Scrambled Sobol normals for shape (n, ..., steps) through the inverse normal and a Brownian bridge along the last axis
+# the leading Sobol dimensions drive the coarse path shape of every factor, n is split across independently
+# scrambled replications (each rounded up to a power of two points) so an error estimate remains available
+def _sobol_normals(rng, shape, replications, steps):
+    per_replication = _sobol_points(shape[0], replications)
+    n_steps = shape[-1]
+    factors = int(np.prod(shape[1:-1], dtype=int))
+    # SciPy is only loaded when Sobol sampling is asked for
+    from scipy.stats import qmc
+    seed = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(
+        (np.random if rng is None else rng).randint(2**31)
+    )
+    blocks = []
+    for i in range(replications):
+        u = qmc.Sobol(n_steps*factors, scramble=True, seed=seed).random_base2(per_replication.bit_length() - 1)
+        # dimension k drives factor k % factors at bridge level k // factors
+        z = normal.ppf(u).reshape(per_replication, n_steps, factors)
+        blocks.append(_brownian_bridge(np.moveaxis(z, 1, -1), steps))
+    return np.concatenate(blocks).reshape((replications*per_replication,) + tuple(shape[1:]))
+
+
+# Standard normal draws with paths along the first axis
+# antithetic draws half the paths and mirrors them (n is rounded up to an even number so every path has its pair),
+# moment matching rescales every dimension to exactly zero mean and unit variance across paths,
+# sampling="sobol" replaces pseudo-random draws by randomized quasi-Monte Carlo (steps is the time grid of the last axis)
+# and dtype=np.float32 returns single precision draws, the same numbers rounded, cast block by block so no double
+# precision copy of the whole draw is made
+def _standard_normals(
+    rng, shape, variance_reduction=None, sampling="pseudo", replications=16, steps=None, dtype=np.float64
+        ):
+    modes = _variance_reduction_modes(variance_reduction)
+    if sampling not in SAMPLING_MODES:
+        raise ValueError("Sampling must be one of " + ", ".join(SAMPLING_MODES))
+    n = (shape[0] + 1)//2 if "antithetic" in modes else shape[0]
+    with instrumentation.stage("rng"):
+        if sampling == "sobol":
+            z = _sobol_normals(
+                rng, (n,) + tuple(shape[1:]), replications, np.ones(shape[-1]) if steps is None else steps
+            ).astype(dtype, copy=False)
+        elif dtype == np.float64:
+            z = (np.random if rng is None else rng).standard_normal((n,) + tuple(shape[1:]))
+        else:
+            z = np.empty((n,) + tuple(shape[1:]), dtype=dtype)
+            block = max(NORMAL_BLOCK//max(z[0].size, 1), 1)
+            for start in range(0, n, block):
+                source = np.random if rng is None else rng
+                z[start:start + block] = source.standard_normal(z[start:start + block].shape)
+    instrumentation.count("rng_draws", z.size)
+    if "antithetic" in modes:
+        z = np.concatenate((z, -z))
+    if "moment_matching" in modes and len(z) > 1:
+        # moments accumulated in double precision whatever the draws are stored in
+        z -= np.mean(z, axis=0, dtype=np.float64)
+        z /= np.std(z, axis=0, dtype=np.float64)
+    return z
+
+
+# Normals of one time step at a time, (n,) + factors per step, for the streaming engines. Pseudo-random draws are
+# made step by step (antithetic pairs and moment matching hold per step as they do in a full draw), Sobol points
+# need every dimension at once so their matrix is drawn up front
+def _step_normals(
+    rng, n, factors, steps, variance_reduction=None, sampling="pseudo", replications=16, dtype=np.float64
+        ):
+    if sampling == "sobol":
+        z = _standard_normals(
+            rng, (n,) + factors + (len(steps),), variance_reduction, sampling, replications, steps, dtype
+        )
+        for k in range(len(steps)):
+            yield z[..., k]
+    else:
+        for k in range(len(steps)):
+            yield _standard_normals(rng, (n,) + factors, variance_reduction, sampling, replications, dtype=dtype)
+
+
+# Per thread record and replay of engine draws (used by PricingCache): a recording keeps the paths of every engine
+# call normalized to a unit spot, a replay hands them back in call order scaled to a new spot instead of simulating.
+# Both engines are linear in the spot, so a replay equals a fresh simulation from the same draws
+_path_replay = threading.local()
+
+
+class _PathRecording:
+
+    def __enter__(self):
+        _path_replay.recording = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _path_replay.recording = None
+
+    # replays calls when given, records otherwise
+    def __init__(self, calls=None):
+        self.replaying = calls is not None
+        self.calls = [] if calls is None else calls
+        self.position = 0
+
+
+# the recorded (unit spot paths, variances) of the next engine call when it matches key, None otherwise
+def _replay_paths(key):
+    recording = getattr(_path_replay, "recording", None)
+    if key is None or recording is None or not recording.replaying or recording.position >= len(recording.calls):
+        return None
+    recorded_key, unit_paths, variances = recording.calls[recording.position]
+    if recorded_key != key:
+        return None
+    recording.position += 1
+    return unit_paths, variances
+
+
+def _record_paths(key, paths, S, variances=None):
+    recording = getattr(_path_replay, "recording", None)
+    if key is not None and recording is not None and not recording.replaying:
+        recording.calls.append((key, paths/np.reshape(S, (-1, 1)), variances))
 
 
 class GeometricBrownianMotion:
@@ -18,6 +235,73 @@ class GeometricBrownianMotion:
                 step += dt
         return prices
 
+    # Vectorized engine: simulates every path at once from a single (n, steps) normal draw
+    # exact=True steps the log price exactly, exact=False reproduces the Euler scheme of simulate_path
+    # precision="float32" draws and steps the path matrix in single precision (about 1e-6 relative error per price)
+    # times are the observation dates a payoff needs, when given the paths are sampled on the smallest grid through
+    # them (ending at T) instead of every dt, exactly since the log price increments are normal over any interval
+    @staticmethod
+    def simulate_paths(
+        S, mu, sigma, dt, T, n, exact=True, rng=None, variance_reduction=None, sampling="pseudo", replications=16,
+        precision="float64", times=None
+            ):
+        observed = None if times is None else tuple(np.ravel(times))
+        key = repr(("gbm", mu, sigma, dt, T, n, exact, variance_reduction, sampling, replications, precision, observed))
+        replay = _replay_paths(key)
+        if replay is not None:
+            return replay[0]*np.reshape(S, (-1, 1))
+        with instrumentation.stage("diffusion"):
+            steps = _time_steps(dt, T) if times is None else _observation_steps(times, T)
+            paths = _standard_normals(
+                rng, (n, len(steps)), variance_reduction, sampling, replications, steps, _precision_dtype(precision)
+            )
+            paths *= sigma*np.sqrt(steps)
+            if exact:
+                paths += (mu - .5*sigma*sigma)*steps
+                np.cumsum(paths, axis=1, out=paths)
+                np.exp(paths, out=paths)
+            else:
+                paths += 1 + mu*steps
+                np.cumprod(paths, axis=1, out=paths)
+            paths *= np.reshape(S, (-1, 1))
+        instrumentation.count("paths", paths.shape[0])
+        instrumentation.count("path_steps", paths.size)
+        _record_paths(key, paths, S)
+        return paths
+
+    # Streaming engine for Asian payoffs: steps every path over the fixing times only, keeping its log price and the
+    # running sums of prices and log prices, so memory is O(n) whatever the number of fixings. Returns the arithmetic
+    # and geometric averages of every path over times (a time listed twice is fixed twice)
+    @staticmethod
+    def simulate_averages(
+        S, mu, sigma, times, n, rng=None, variance_reduction=None, sampling="pseudo", replications=16,
+        precision="float64"
+            ):
+        times = np.asarray(times, dtype=float).ravel()
+        key = repr(("gbm_averages", mu, sigma, tuple(times), n, variance_reduction, sampling, replications, precision))
+        replay = _replay_paths(key)
+        if replay is not None:
+            averages = replay[0]*np.reshape(S, (-1, 1))
+            return averages[:, 0], averages[:, 1]
+        with instrumentation.stage("diffusion"):
+            steps = _observation_steps(times, times.max())
+            weights = np.bincount(_fixing_columns(times, steps), minlength=len(steps))
+            log_price = np.log(S)
+            total = log_total = 0.
+            normals = _step_normals(
+                rng, n, (), steps, variance_reduction, sampling, replications, _precision_dtype(precision)
+            )
+            for h, weight, z in zip(steps, weights, normals):
+                log_price = log_price + (mu - .5*sigma*sigma)*h + sigma*np.sqrt(h)*z
+                if weight:
+                    total = total + weight*np.exp(log_price)
+                    log_total = log_total + weight*log_price
+            averages = np.column_stack((total/len(times), np.exp(log_total/len(times))))
+        instrumentation.count("paths", len(averages))
+        instrumentation.count("path_steps", len(averages)*len(steps))
+        _record_paths(key, averages, S)
+        return averages[:, 0], averages[:, 1]
+
     def __init__(self, S, mu, sigma, dt, T):
         self.simulated_path = self.simulate_path(S, mu, sigma, dt, T)
 
@@ -31,8 +315,8 @@ class StochasticVarianceModel:
         prev_inst_var = inst_var_now
         step = 0
         while step < T:
-            e1 = norm.ppf(np.random.random())
-            e2 = e1*rho + np.sqrt(1-(rho**2))*norm.ppf(np.random.random())
+            e1 = normal.ppf(np.random.random())
+            e2 = e1*rho + np.sqrt(1-(rho**2))*normal.ppf(np.random.random())
             price_now = price_now + (r - div) * price_now * dt + price_now * np.sqrt(prev_inst_var * dt) * e1
             prev_inst_var = inst_var_now
             inst_var_now = prev_inst_var + alpha*(beta - prev_inst_var)*dt + vol_var*np.sqrt(prev_inst_var*dt)*e2
@@ -49,397 +333,1499 @@ class StochasticVarianceModel:
                 step += dt
         return prices
 
+    # Vectorized engine: advances price and variance of every path together from correlated normals drawn in bulk
+    # variance_fix="truncate" floors the variance as simulate_path does, "reflect" takes its absolute value
+    # precision="float32" draws and stores the path matrices in single precision, the per path state being stepped
+    # stays in double precision so errors do not build up along the path
+    @staticmethod
+    def simulate_paths(
+        S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_fix="truncate", return_variance=False,
+        rng=None, variance_reduction=None, sampling="pseudo", replications=16, precision="float64"
+            ):
+        # paths started from per path variances are neither recorded nor replayed
+        key = repr((
+            "svm", mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_fix, return_variance,
+            variance_reduction, sampling, replications, precision
+        )) if np.ndim(inst_var) == 0 else None
+        replay = _replay_paths(key)
+        if replay is not None:
+            prices = replay[0]*np.reshape(S, (-1, 1))
+            return (prices, replay[1].copy()) if return_variance else prices
+        with instrumentation.stage("diffusion"):
+            steps = _time_steps(dt, T)
+            dtype = _precision_dtype(precision)
+            z = _standard_normals(rng, (n, 2, len(steps)), variance_reduction, sampling, replications, steps, dtype)
+            n = len(z)
+            e1, e2 = z[:, 0], z[:, 1]
+            e2 *= np.sqrt(1 - rho*rho)
+            e2 += rho*e1
+            prices = np.empty((n, len(steps)), dtype=dtype)
+            variances = np.empty((n, len(steps)), dtype=dtype) if return_variance else None
+            price_now = np.zeros(n) + S
+            inst_var_now = np.zeros(n) + inst_var
+            for k, h in enumerate(steps):
+                # log-Euler step for the price keeps every path positive
+                price_now *= np.exp((r - div - .5*inst_var_now)*h + np.sqrt(inst_var_now*h)*e1[:, k])
+                inst_var_now = inst_var_now + alpha*(beta - inst_var_now)*h + vol_var*np.sqrt(inst_var_now*h)*e2[:, k]
+                if variance_fix == "reflect":
+                    np.abs(inst_var_now, out=inst_var_now)
+                else:
+                    np.maximum(inst_var_now, .0000001, out=inst_var_now)
+                prices[:, k] = price_now
+                if return_variance:
+                    variances[:, k] = inst_var_now
+        instrumentation.count("paths", prices.shape[0])
+        instrumentation.count("path_steps", prices.size)
+        _record_paths(key, prices, S, variances.copy() if return_variance else None)
+        if return_variance:
+            return prices, variances
+        return prices
+
+    # Streaming engine for Asian payoffs: steps price and variance of every path along the dt grid keeping only the
+    # running sums of prices and log prices at the fixings (each on the first grid point at or after its time), so
+    # memory is O(n) whatever the number of steps. Returns the arithmetic and geometric averages over times
+    @staticmethod
+    def simulate_averages(
+        S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, times, n, variance_fix="truncate", rng=None,
+        variance_reduction=None, sampling="pseudo", replications=16, precision="float64"
+            ):
+        times = np.asarray(times, dtype=float).ravel()
+        key = repr((
+            "svm_averages", mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, tuple(times), n, variance_fix,
+            variance_reduction, sampling, replications, precision
+        )) if np.ndim(inst_var) == 0 else None
+        replay = _replay_paths(key)
+        if replay is not None:
+            averages = replay[0]*np.reshape(S, (-1, 1))
+            return averages[:, 0], averages[:, 1]
+        with instrumentation.stage("diffusion"):
+            steps = _time_steps(dt, T)
+            weights = np.bincount(_fixing_columns(times, steps), minlength=len(steps))
+            log_price = np.log(S)
+            inst_var_now = inst_var
+            total = log_total = 0.
+            normals = _step_normals(
+                rng, n, (2,), steps, variance_reduction, sampling, replications, _precision_dtype(precision)
+            )
+            for h, weight, z in zip(steps, weights, normals):
+                e1 = z[:, 0]
+                e2 = rho*e1 + np.sqrt(1 - rho*rho)*z[:, 1]
+                log_price = log_price + (r - div - .5*inst_var_now)*h + np.sqrt(inst_var_now*h)*e1
+                inst_var_now = inst_var_now + alpha*(beta - inst_var_now)*h + vol_var*np.sqrt(inst_var_now*h)*e2
+                if variance_fix == "reflect":
+                    np.abs(inst_var_now, out=inst_var_now)
+                else:
+                    np.maximum(inst_var_now, .0000001, out=inst_var_now)
+                if weight:
+                    total = total + weight*np.exp(log_price)
+                    log_total = log_total + weight*log_price
+            averages = np.column_stack((total/len(times), np.exp(log_total/len(times))))
+        instrumentation.count("paths", len(averages))
+        instrumentation.count("path_steps", len(averages)*len(steps))
+        _record_paths(key, averages, S)
+        return averages[:, 0], averages[:, 1]
+
     def __init__(self, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
         self.simulated_path = self.simulate_path(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
 
 
-class MonteCarloCall:
+# Probability that each path stays on its side of the barrier
+# monitoring="discrete" checks every point of the simulation grid, "continuous" also applies the Brownian bridge
+# probability of crossing between grid points (variance is the instantaneous variance of the log price, per path
+# and step where it is stochastic) and an array of times monitors on the grid points of that schedule only
+def _barrier_survival(paths, S, barrier, up, steps, variance, monitoring="discrete"):
+    if isinstance(monitoring, str):
+        if monitoring not in ("discrete", "continuous"):
+            raise ValueError("Monitoring must be discrete, continuous or an array of monitoring times")
+        monitored = paths
+    else:
+        index = np.searchsorted(np.cumsum(steps), np.asarray(monitoring, dtype=float) - 1e-9)
+        monitored = paths[:, np.unique(np.minimum(index, len(steps) - 1))]
+    if up:
+        survival = (monitored < barrier).all(axis=1).astype(float)
+    else:
+        survival = (monitored > barrier).all(axis=1).astype(float)
+    if instrumentation.active() is not None:
+        instrumentation.count("barrier_hits", np.count_nonzero(survival == 0))
+    if isinstance(monitoring, str) and monitoring == "continuous":
+        distance = np.log(barrier) - np.log(np.hstack((np.full((len(paths), 1), float(S)), paths)))
+        # intervals that end across the barrier have already zeroed survival, clamp them away from overflow
+        crossing = np.exp(-2*np.maximum(distance[:, :-1]*distance[:, 1:], 0)/(variance*steps))
+        survival *= np.prod(1 - crossing, axis=1)
+    return survival
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] >= strike):
-                payouts.append((GBM.simulated_path[-1]-strike)*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] >= strike):
-                payouts.append((SVM.simulated_path[-1]-strike)*np.exp(-r*T))
+
+# Knock-out paths pay the vanilla payout while they survive, knock-in paths once they have crossed,
+# the rebate is paid at expiry otherwise
+def _barrier_payouts(vanilla, survival, out, rebate):
+    if out:
+        return survival*vanilla + (1 - survival)*rebate
+    return (1 - survival)*vanilla + survival*rebate
+
+
+# Share of the future fixings in an Asian average and the strike their own average has to beat once past_fixings
+# fixings averaging average are accounted for, the payoff is weight times that of the future average at that strike
+def _partial_average(strike, fixings, average, past_fixings):
+    if average is None or past_fixings == 0:
+        return 1., strike
+    total = past_fixings + len(fixings)
+    return len(fixings)/total, (total*strike - past_fixings*average)/len(fixings)
+
+
+# Greek estimator for a greeks argument, True picks the default suited to the payoff, pathwise differentiation
+# misses the jumps of binary and barrier payoffs
+def _greek_method(greeks, default, jumps=False):
+    if greeks is True:
+        return default
+    if greeks not in GREEK_METHODS:
+        raise ValueError("Greeks must be True or one of " + ", ".join(GREEK_METHODS))
+    if jumps and greeks == "pathwise":
+        raise ValueError("Pathwise greeks need a continuous payoff, use likelihood_ratio or bump")
+    return greeks
+
+
+# Common random number rebuild of GBM paths at another volatility and the likelihood ratio scores of the paths for S
+# (first and second derivative) and sigma, both from the normals recovered from the simulated log increments
+def _gbm_greek_inputs(paths, S, mu, sigma, steps):
+    with instrumentation.stage("greeks"):
+        increments = np.diff(np.log(paths), axis=1, prepend=np.log(S))
+        z = (increments - (mu - .5*sigma*sigma)*steps)/(sigma*np.sqrt(steps))
+
+    def rebuild(vol):
+        return S*np.exp(np.cumsum((mu - .5*vol*vol)*steps + vol*np.sqrt(steps)*z, axis=1)), vol*vol
+
+    # only the first step depends on S directly
+    z0, h = z[:, 0], steps[0]
+    scores = (
+        z0/(S*sigma*np.sqrt(h)),
+        (z0*z0 - 1)/(S*S*sigma*sigma*h) - z0/(S*S*sigma*np.sqrt(h)),
+        np.sum((z*z - 1)/sigma - z*np.sqrt(steps), axis=1)
+    )
+    return rebuild, scores
+
+
+def _random_state(rng):
+    if isinstance(rng, np.random.Generator):
+        return rng.bit_generator.state
+    return (np.random if rng is None else rng).get_state()
+
+
+def _restore_random_state(rng, state):
+    if isinstance(rng, np.random.Generator):
+        rng.bit_generator.state = state
+    else:
+        (np.random if rng is None else rng).set_state(state)
+
+
+# Common random number rebuild of stochastic variance paths at another initial volatility: the random state the
+# paths were drawn from is restored before the rerun so every path sees the same draws. Returns the prices and the
+# variance driving each step
+def _svm_rebuild(rng, state, S, mu, r, div, alpha, beta, rho, vol_var, dt, T, n, **kwargs):
+
+    def rebuild(vol):
+        _restore_random_state(rng, state)
+        paths, variances = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, vol*vol, dt, T, n, return_variance=True, rng=rng, **kwargs
+        )
+        return paths, np.hstack((np.full((len(variances), 1), vol*vol), variances[:, :-1]))
+
+    return rebuild
+
+
+# Running mean and variance of Monte Carlo samples (and their covariance with a control variate)
+# batches are folded in with the pairwise update of Chan et al., so partial results from chunks, workers
+# or streams merge exactly, expected_control is the known expectation of the control variate
+class MonteCarloAccumulator:
+
+    # Fold a batch of samples into the running statistics, payouts are the raw per path payouts the
+    # variance reduction factor is measured against (the samples themselves when omitted)
+    def add(self, samples, control=None, payouts=None):
+        samples = np.asarray(samples, dtype=float)
+        if len(samples) == 0:
+            return self
+        batch = MonteCarloAccumulator(self.expected_control)
+        batch.count = len(samples)
+        batch.mean = np.average(samples, axis=0)
+        deviations = samples - batch.mean
+        batch.m2 = np.sum(deviations*deviations, axis=0)
+        if control is not None:
+            batch.control_mean = np.average(control)
+            control_deviations = control - batch.control_mean
+            batch.control_m2 = np.dot(control_deviations, control_deviations)
+            batch.comoment = np.dot(control_deviations, deviations)
+        payouts = samples if payouts is None else np.asarray(payouts, dtype=float)
+        batch.raw_count = len(payouts)
+        batch.raw_mean = np.average(payouts, axis=0)
+        deviations = payouts - batch.raw_mean
+        batch.raw_m2 = np.sum(deviations*deviations, axis=0)
+        return self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        count = self.count + other.count
+        weight = self.count*other.count/count
+        delta = other.mean - self.mean
+        control_delta = other.control_mean - self.control_mean
+        self.comoment = self.comoment + other.comoment + weight*control_delta*delta
+        self.control_m2 = self.control_m2 + other.control_m2 + weight*control_delta*control_delta
+        self.control_mean = self.control_mean + control_delta*other.count/count
+        self.m2 = self.m2 + other.m2 + weight*delta*delta
+        self.mean = self.mean + delta*other.count/count
+        self.count = count
+        raw_count = self.raw_count + other.raw_count
+        delta = other.raw_mean - self.raw_mean
+        self.raw_m2 = self.raw_m2 + other.raw_m2 + self.raw_count*other.raw_count/raw_count*delta*delta
+        self.raw_mean = self.raw_mean + delta*other.raw_count/raw_count
+        self.raw_count = raw_count
+        return self
+
+    # optimal control variate coefficient, zero when no control was accumulated
+    def beta(self):
+        if self.expected_control is None or not np.all(self.control_m2 > 0):
+            return 0.
+        return self.comoment/self.control_m2
+
+    @property
+    def price(self):
+        if self.expected_control is None:
+            return self.mean
+        return self.mean - self.beta()*(self.control_mean - self.expected_control)
+
+    @property
+    def variance(self):
+        # a control that explains the payouts exactly leaves only rounding, which may fall below zero
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.maximum(self.m2 - self.beta()*self.comoment, 0)/(self.count - 1)
+
+    @property
+    def standard_error(self):
+        return np.sqrt(self.variance/self.count)
+
+    @property
+    def variance_reduction_factor(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.raw_m2/(self.raw_count - 1)/self.raw_count/(self.variance/self.count)
+
+    # two-sided normal confidence interval for the price
+    def confidence_interval(self, level=.95):
+        half_width = normal.ppf(.5 + .5*level)*self.standard_error
+        return self.price - half_width, self.price + half_width
+
+    def __init__(self, expected_control=None):
+        self.expected_control = expected_control
+        self.count = self.raw_count = 0
+        self.mean = self.m2 = self.raw_mean = self.raw_m2 = 0.
+        self.control_mean = self.control_m2 = self.comoment = 0.
+
+
+# Base class for the Monte Carlo pricers, turns discounted payouts into a price estimate
+class MonteCarloPricer:
+
+    # Stores the accumulated statistics, the standard error and the achieved variance reduction factor (plain Monte
+    # Carlo variance over the variance of the estimator used) alongside the returned price, control is a per path
+    # control variate with known expectation control_mean. Moment matching can't be measured from a single run and
+    # is not reflected. Sobol sampled paths are not independent, their error comes from the replication means
+    def estimate(
+        self, payouts, control=None, control_mean=None, variance_reduction=None, sampling="pseudo", replications=16
+            ):
+        instrumentation.lap("payoff")
+        with instrumentation.stage("estimate"):
+            return self._estimate(payouts, control, control_mean, variance_reduction, sampling, replications)
+
+    def _estimate(self, payouts, control, control_mean, variance_reduction, sampling, replications):
+        # single precision payouts are reduced in double precision (NumPy sums pairwise)
+        payouts = np.asarray(payouts, dtype=float)
+        control = None if control is None else np.asarray(control, dtype=float)
+        modes = _variance_reduction_modes(variance_reduction)
+        samples = payouts
+        if "control_variate" not in modes:
+            control = control_mean = None
+        if "antithetic" in modes:
+            # antithetic pairs are (i, i + n/2), their averages are independent
+            half = len(samples)//2
+            samples = .5*(samples[:half] + samples[half:2*half])
+            if control is not None:
+                control = .5*(control[:half] + control[half:2*half])
+        if sampling == "sobol":
+            if control is not None:
+                # the control coefficient is fitted on the paths, the replication means are too few for it
+                centred = control - np.average(control)
+                denominator = np.dot(centred, centred)
+                if denominator > 0:
+                    beta = np.dot(centred, samples - np.average(samples, axis=0))/denominator
+                    samples = samples - np.multiply.outer(control - control_mean, beta)
+                control = control_mean = None
+            samples = np.average(samples.reshape((replications, -1) + samples.shape[1:]), axis=1)
+        self.accumulator = MonteCarloAccumulator(control_mean).add(samples, control, payouts)
+        self.standard_error = self.accumulator.standard_error
+        self.variance_reduction_factor = self.accumulator.variance_reduction_factor
+        return self.accumulator.price
+
+    # Greeks of payoff(paths, S, variance) when greeks is set (True picks default, jumps refuses pathwise for
+    # discontinuous payoffs). gbm is (mu, sigma, steps) of geometric Brownian motion paths, svm is (rng, state, mu, r,
+    # div, alpha, beta, rho, vol_var, inst_var, dt, T, n) of stochastic variance paths drawn from the random state
+    def path_greeks(
+        self, greeks, default, payoff, paths, variance, S, variance_reduction, sampling, replications, gbm=None,
+        svm=None, jumps=False
+            ):
+        if not greeks:
+            return
+        method = _greek_method(greeks, default, jumps)
+        if gbm is not None:
+            mu, sigma, steps = gbm
+            rebuild, scores = _gbm_greek_inputs(paths, S, mu, sigma, steps)
+            self.estimate_greeks(
+                payoff, paths, variance, S, sigma, rebuild, scores, method, variance_reduction, sampling, replications
+            )
+        else:
+            rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n = svm
+            rebuild = _svm_rebuild(
+                rng, state, S, mu, r, div, alpha, beta, rho, vol_var, dt, T, n, variance_reduction=variance_reduction,
+                sampling=sampling, replications=replications
+            )
+            self.estimate_greeks(
+                payoff, paths, variance, S, np.sqrt(inst_var), rebuild, None, method, variance_reduction, sampling,
+                replications
+            )
+
+    # Delta, gamma and vega from the paths the price was simulated on, each with its own standard error
+    # (delta_standard_error, ...). payoff(paths, S, variance) gives the discounted payouts and rebuild(vol) the paths
+    # and variance from the same random draws at another volatility. "pathwise" differentiates Lipschitz payoffs path
+    # by path, "likelihood_ratio" weights the payouts by the GBM path density scores and "bump" takes finite common
+    # random number differences. Pathwise gamma is the mixed pathwise/likelihood ratio estimator when scores are known
+    def estimate_greeks(
+        self, payoff, paths, variance, S, vol, rebuild, scores=None, method="pathwise", variance_reduction=None,
+        sampling="pseudo", replications=16
+            ):
+        instrumentation.lap("payoff")
+        with instrumentation.stage("greeks"):
+            self._estimate_greeks(
+                payoff, paths, variance, S, vol, rebuild, scores, method, variance_reduction, sampling, replications
+            )
+
+    def _estimate_greeks(
+        self, payoff, paths, variance, S, vol, rebuild, scores, method, variance_reduction, sampling, replications
+            ):
+        # the bumps are below single precision resolution
+        paths = np.asarray(paths, dtype=float)
+        if method == "likelihood_ratio":
+            if scores is None:
+                raise ValueError("Likelihood ratio greeks need a model with a known path density")
+            payouts = payoff(paths, S, variance)
+            greeks = {"delta": payouts*scores[0], "gamma": payouts*scores[1], "vega": payouts*scores[2]}
+        else:
+            # paths scale with S in both models, so S bumps reuse the simulated paths
+            def bumped(size):
+                return payoff(paths*(1 + size), S*(1 + size), variance)
+            size = 1e-6 if method == "pathwise" else .01
+            greeks = {"delta": (bumped(size) - bumped(-size))/(2*size*S)}
+            if method == "pathwise" and scores is not None:
+                greeks["gamma"] = greeks["delta"]*(scores[0] - 1/S)
             else:
-                payouts.append(0)
-        return np.average(payouts)
+                greeks["gamma"] = (bumped(.01) - 2*payoff(paths, S, variance) + bumped(-.01))/(.0001*S*S)
+            up_paths, up_variance = rebuild(vol*(1 + size))
+            down_paths, down_variance = rebuild(vol*(1 - size))
+            greeks["vega"] = (payoff(up_paths, S, up_variance) - payoff(down_paths, S, down_variance))/(2*size*vol)
+        modes = _variance_reduction_modes(variance_reduction)
+        for name, samples in greeks.items():
+            if "antithetic" in modes:
+                half = len(samples)//2
+                samples = .5*(samples[:half] + samples[half:2*half])
+            if sampling == "sobol":
+                samples = np.average(samples.reshape(replications, -1), axis=1)
+            accumulator = MonteCarloAccumulator().add(samples)
+            setattr(self, name, accumulator.price)
+            setattr(self, name + "_standard_error", accumulator.standard_error)
+
+
+class MonteCarloCall(MonteCarloPricer):
+
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16, rng=None,
+        greeks=False, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.maximum(paths[:, -1] - strike, 0)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "pathwise", payoff, terminal[:, None], sigma*sigma, S, variance_reduction, sampling, replications,
+            gbm=(mu, sigma, np.array([T]))
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        terminal = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+            sampling=sampling, replications=replications, rng=rng, precision=precision
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.maximum(paths[:, -1] - strike, 0)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "pathwise", payoff, terminal[:, None], None, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n)
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks, precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction, sampling,
+                replications, rng, greeks, precision
+            )
 
 
-class MonteCarloPut:
+class MonteCarloPut(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] <= strike):
-                payouts.append((strike-GBM.simulated_path[-1])*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] <= strike):
-                payouts.append((strike-SVM.simulated_path[-1])*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16, rng=None,
+        greeks=False, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.maximum(strike - paths[:, -1], 0)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "pathwise", payoff, terminal[:, None], sigma*sigma, S, variance_reduction, sampling, replications,
+            gbm=(mu, sigma, np.array([T]))
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        terminal = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+            sampling=sampling, replications=replications, rng=rng, precision=precision
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.maximum(strike - paths[:, -1], 0)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "pathwise", payoff, terminal[:, None], None, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n)
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks, precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction, sampling,
+                replications, rng, greeks, precision
+            )
 
 
-class MonteCarloBinaryCall:
+class MonteCarloBinaryCall(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, payout, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] >= strike):
-                payouts.append(payout*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] >= strike):
-                payouts.append(payout*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
+    def simulate_price_gbm(
+        self, strike, n, payout, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16,
+        rng=None, greeks=False, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.where(paths[:, -1] >= strike, payout*np.exp(-r*T), 0)
+
+        self.path_greeks(
+            greeks, "likelihood_ratio", payoff, terminal[:, None], sigma*sigma, S, variance_reduction, sampling,
+            replications, gbm=(mu, sigma, np.array([T])), jumps=True
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        terminal = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+            sampling=sampling, replications=replications, rng=rng, precision=precision
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.where(paths[:, -1] >= strike, payout*np.exp(-r*T), 0)
 
-    def __init__(self, strike, n, payout, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+        self.path_greeks(
+            greeks, "bump", payoff, terminal[:, None], None, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n), jumps=True
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
+
+    def __init__(
+        self, strike, n, payout, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, payout, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, payout, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks,
+                precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction,
+                sampling, replications, rng, greeks, precision
+            )
 
 
-class MonteCarloBinaryPut:
+class MonteCarloBinaryPut(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, payout, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] <= strike):
-                payouts.append(payout*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] <= strike):
-                payouts.append(payout*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
+    def simulate_price_gbm(
+        self, strike, n, payout, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16,
+        rng=None, greeks=False, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.where(paths[:, -1] <= strike, payout*np.exp(-r*T), 0)
+
+        self.path_greeks(
+            greeks, "likelihood_ratio", payoff, terminal[:, None], sigma*sigma, S, variance_reduction, sampling,
+            replications, gbm=(mu, sigma, np.array([T])), jumps=True
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        terminal = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+            sampling=sampling, replications=replications, rng=rng, precision=precision
+        )[:, -1]
+
+        def payoff(paths, S, variance):
+            return np.where(paths[:, -1] <= strike, payout*np.exp(-r*T), 0)
 
-    def __init__(self, strike, n, payout, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+        self.path_greeks(
+            greeks, "bump", payoff, terminal[:, None], None, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n), jumps=True
+        )
+        return self.estimate(
+            payoff(terminal[:, None], S, None), terminal*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
+
+    def __init__(
+        self, strike, n, payout, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, payout, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, payout, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks,
+                precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-
-
-class MonteCarloBarrierCall:
-
-    def simulate_price_gbm(self, strike, n, barrier, up, out, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            payouts = []
-            for i in range(0, n):
-                barrier_triggered = False
-                GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-                for price in GBM.simulated_path:
-                    if up:
-                        if(price >= barrier):
-                            barrier_triggered = True
-                            break
-                    elif not up:
-                        if(price <= barrier):
-                            barrier_triggered = True
-                            break
-                if out and not barrier_triggered:
-                    if GBM.simulated_path[-1] >= strike:
-                        payouts.append((GBM.simulated_path[-1]-strike)*np.exp(-r*T))
-                    else:
-                        payouts.append(0)
-                elif not out and barrier_triggered:
-                    if GBM.simulated_path[-1] >= strike:
-                        payouts.append((GBM.simulated_path[-1]-strike)*np.exp(-r*T))
-                    else:
-                        payouts.append(0)
-                else:
-                    payouts.append(0)
-            return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            barrier_triggered = False
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            for price in SVM.simulated_path:
-                if up:
-                    if(price >= barrier):
-                        barrier_triggered = True
-                        break
-                elif not up:
-                    if(price <= barrier):
-                        barrier_triggered = True
-                        break
-            if out and not barrier_triggered:
-                if SVM.simulated_path[-1] >= strike:
-                    payouts.append((SVM.simulated_path[-1]-strike)*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-            elif not out and barrier_triggered:
-                if SVM.simulated_path[-1] >= strike:
-                    payouts.append((SVM.simulated_path[-1]-strike)*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-            else:
-                payouts.append(0)
-        return np.average(payouts)
+            self.price = self.simulate_price_svm(
+                strike, n, payout, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction,
+                sampling, replications, rng, greeks, precision
+            )
+
 
-    def __init__(self, strike, n, barrier, r, S, mu, sigma, dt, T, up=True, out=True, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+class MonteCarloBarrierCall(MonteCarloPricer):
+
+    def simulate_price_gbm(
+        self, strike, n, barrier, up, out, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo",
+        replications=16, rng=None, rebate=0, monitoring="discrete", greeks=False, precision="float64"
+            ):
+        # a monitoring schedule is all the payoff observes, continuous monitoring needs every dt for its correction
+        times = None if isinstance(monitoring, str) else monitoring
+        steps = _time_steps(dt, T) if times is None else _observation_steps(times, T)
+        paths = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=times
+        )
+
+        def payoff(paths, S, variance):
+            survival = _barrier_survival(paths, S, barrier, up, steps, variance, monitoring)
+            return _barrier_payouts(np.maximum(paths[:, -1] - strike, 0), survival, out, rebate)*np.exp(-r*T)
+
+        # the continuous monitoring correction depends on S and sigma beyond the path density
+        default = "bump" if isinstance(monitoring, str) and monitoring == "continuous" else "likelihood_ratio"
+        self.path_greeks(
+            greeks, default, payoff, paths, sigma*sigma, S, variance_reduction, sampling, replications,
+            gbm=(mu, sigma, steps), jumps=True
+        )
+        return self.estimate(
+            payoff(paths, S, sigma*sigma), paths[:, -1]*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, rebate=0, monitoring="discrete",
+        greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        paths, variances = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, return_variance=True,
+            variance_reduction=variance_reduction, sampling=sampling, replications=replications, rng=rng,
+            precision=precision
+        )
+        # step k of the price is driven by the variance at the start of the step
+        variances = np.hstack((np.full((len(variances), 1), inst_var), variances[:, :-1]))
+
+        def payoff(paths, S, variance):
+            survival = _barrier_survival(paths, S, barrier, up, _time_steps(dt, T), variance, monitoring)
+            return _barrier_payouts(np.maximum(paths[:, -1] - strike, 0), survival, out, rebate)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "bump", payoff, paths, variances, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n), jumps=True
+        )
+        return self.estimate(
+            payoff(paths, S, variances), paths[:, -1]*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
+
+    def __init__(
+        self, strike, n, barrier, r, S, mu, sigma, dt, T, up=True, out=True, alpha=None, beta=None, rho=None, div=None,
+        vol_var=None, variance_reduction=None, sampling="pseudo", replications=16, rng=None, rebate=0,
+        monitoring="discrete", greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, barrier, up, out, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, barrier, up, out, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng,
+                rebate, monitoring, greeks, precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-
-
-class MonteCarloBarrierPut:
-
-    def simulate_price_gbm(self, strike, n, barrier, up, out, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            payouts = []
-            for i in range(0, n):
-                barrier_triggered = False
-                GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-                for price in GBM.simulated_path:
-                    if up:
-                        if(price >= barrier):
-                            barrier_triggered = True
-                            break
-                    elif not up:
-                        if(price <= barrier):
-                            barrier_triggered = True
-                            break
-                if out and not barrier_triggered:
-                    if GBM.simulated_path[-1] <= strike:
-                        payouts.append((strike - GBM.simulated_path[-1])*np.exp(-r*T))
-                    else:
-                        payouts.append(0)
-                elif not out and barrier_triggered:
-                    if GBM.simulated_path[-1] <= strike:
-                        payouts.append((strike - GBM.simulated_path[-1])*np.exp(-r*T))
-                    else:
-                        payouts.append(0)
-                else:
-                    payouts.append(0)
-            return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            barrier_triggered = False
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            for price in SVM.simulated_path:
-                if up:
-                    if(price >= barrier):
-                        barrier_triggered = True
-                        break
-                elif not up:
-                    if(price <= barrier):
-                        barrier_triggered = True
-                        break
-            if out and not barrier_triggered:
-                if SVM.simulated_path[-1] <= strike:
-                    payouts.append((strike - SVM.simulated_path[-1])*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-            elif not out and barrier_triggered:
-                if SVM.simulated_path[-1] <= strike:
-                    payouts.append((strike - SVM.simulated_path[-1])*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-            else:
-                payouts.append(0)
-        return np.average(payouts)
+            self.price = self.simulate_price_svm(
+                strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T,
+                variance_reduction, sampling, replications, rng, rebate, monitoring, greeks, precision
+            )
+
+
+class MonteCarloBarrierPut(MonteCarloPricer):
 
-    def __init__(self, strike, n, barrier, r, S, mu, sigma, dt, T, up=True, out=True, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    def simulate_price_gbm(
+        self, strike, n, barrier, up, out, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo",
+        replications=16, rng=None, rebate=0, monitoring="discrete", greeks=False, precision="float64"
+            ):
+        # a monitoring schedule is all the payoff observes, continuous monitoring needs every dt for its correction
+        times = None if isinstance(monitoring, str) else monitoring
+        steps = _time_steps(dt, T) if times is None else _observation_steps(times, T)
+        paths = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=times
+        )
+
+        def payoff(paths, S, variance):
+            survival = _barrier_survival(paths, S, barrier, up, steps, variance, monitoring)
+            return _barrier_payouts(np.maximum(strike - paths[:, -1], 0), survival, out, rebate)*np.exp(-r*T)
+
+        # the continuous monitoring correction depends on S and sigma beyond the path density
+        default = "bump" if isinstance(monitoring, str) and monitoring == "continuous" else "likelihood_ratio"
+        self.path_greeks(
+            greeks, default, payoff, paths, sigma*sigma, S, variance_reduction, sampling, replications,
+            gbm=(mu, sigma, steps), jumps=True
+        )
+        return self.estimate(
+            payoff(paths, S, sigma*sigma), paths[:, -1]*np.exp(-r*T), S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    def simulate_price_svm(
+        self, strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, rebate=0, monitoring="discrete",
+        greeks=False, precision="float64"
+            ):
+        state = _random_state(rng) if greeks else None
+        paths, variances = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, return_variance=True,
+            variance_reduction=variance_reduction, sampling=sampling, replications=replications, rng=rng,
+            precision=precision
+        )
+        # step k of the price is driven by the variance at the start of the step
+        variances = np.hstack((np.full((len(variances), 1), inst_var), variances[:, :-1]))
+
+        def payoff(paths, S, variance):
+            survival = _barrier_survival(paths, S, barrier, up, _time_steps(dt, T), variance, monitoring)
+            return _barrier_payouts(np.maximum(strike - paths[:, -1], 0), survival, out, rebate)*np.exp(-r*T)
+
+        self.path_greeks(
+            greeks, "bump", payoff, paths, variances, S, variance_reduction, sampling, replications,
+            svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n), jumps=True
+        )
+        return self.estimate(
+            payoff(paths, S, variances), paths[:, -1]*np.exp(-r*T), S*np.exp(-div*T), variance_reduction, sampling,
+            replications
+        )
+
+    def __init__(
+        self, strike, n, barrier, r, S, mu, sigma, dt, T, up=True, out=True, alpha=None, beta=None, rho=None, div=None,
+        vol_var=None, variance_reduction=None, sampling="pseudo", replications=16, rng=None, rebate=0,
+        monitoring="discrete", greeks=False, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, barrier, up, out, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, barrier, up, out, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng,
+                rebate, monitoring, greeks, precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, barrier, up, out, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T,
+                variance_reduction, sampling, replications, rng, rebate, monitoring, greeks, precision
+            )
 
 
-class MonteCarloAsianCall:
+class MonteCarloAsianCall(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(np.average(GBM.simulated_path) >= strike):
-                payouts.append((np.average(GBM.simulated_path) - strike)*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(np.average(SVM.simulated_path) >= strike):
-                payouts.append((np.average(SVM.simulated_path) - strike)*np.exp(-r*T))
+    # fixings: future fixing times (every step of the grid by default), average: average of the past_fixings fixings
+    # already made. Prices come from the streaming engines, paths are only simulated (on the fixing dates under
+    # geometric Brownian motion) when greeks are asked for
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16, rng=None,
+        greeks=False, precision="float64", fixings=None, average=None, past_fixings=0
+            ):
+        fixings = _fixing_times(fixings, dt, T)
+        weight, strike = _partial_average(strike, fixings, average, past_fixings)
+        discount = weight*np.exp(-r*T)
+        if greeks:
+            steps = _observation_steps(fixings, T)
+            columns = _fixing_columns(fixings, steps)
+            paths = GeometricBrownianMotion.simulate_paths(
+                S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, rng=rng, precision=precision, times=fixings
+            )
+
+            def payoff(paths, S, variance):
+                return np.maximum(np.mean(paths[:, columns], axis=1, dtype=float) - strike, 0)*discount
+
+            self.path_greeks(
+                greeks, "pathwise", payoff, paths, sigma*sigma, S, variance_reduction, sampling, replications,
+                gbm=(mu, sigma, steps)
+            )
+            arithmetic = np.mean(paths[:, columns], axis=1, dtype=float)
+            geometric = np.exp(np.mean(np.log(paths[:, columns]), axis=1, dtype=float))
+        else:
+            arithmetic, geometric = GeometricBrownianMotion.simulate_averages(
+                S, mu, sigma, fixings, n, rng=rng, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, precision=precision
+            )
+        payouts = np.maximum(arithmetic - strike, 0)*discount
+        control = control_mean = None
+        if "control_variate" in _variance_reduction_modes(variance_reduction):
+            if strike > 0:
+                # the geometric-average Asian has a closed form and is highly correlated with the arithmetic one
+                control = np.maximum(geometric - strike, 0)*discount
+                control_mean = weight*GeometricAsianOption(
+                    S, sigma, strike, fixings, r, "CALL", drift=mu
+                ).price*np.exp(-r*(T - fixings[-1]))
             else:
-                payouts.append(0)
-        return np.average(payouts)
+                # past fixings already decide the option, the average itself is the control
+                control = arithmetic*discount
+                control_mean = S*np.average(np.exp(mu*fixings))*discount
+        return self.estimate(payouts, control, control_mean, variance_reduction, sampling, replications)
+
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64", fixings=None, average=None,
+        past_fixings=0
+            ):
+        fixings = _fixing_times(fixings, dt, T)
+        weight, strike = _partial_average(strike, fixings, average, past_fixings)
+        discount = weight*np.exp(-r*T)
+        columns = _fixing_columns(fixings, _time_steps(dt, T))
+        if greeks:
+            state = _random_state(rng)
+            paths = StochasticVarianceModel.simulate_paths(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+                sampling=sampling, replications=replications, rng=rng, precision=precision
+            )
+            averages = np.mean(paths[:, columns], axis=1, dtype=float)
+
+            def payoff(paths, S, variance):
+                return np.maximum(np.mean(paths[:, columns], axis=1, dtype=float) - strike, 0)*discount
+
+            self.path_greeks(
+                greeks, "pathwise", payoff, paths, None, S, variance_reduction, sampling, replications,
+                svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n)
+            )
+        else:
+            averages = StochasticVarianceModel.simulate_averages(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, fixings, n, rng=rng,
+                variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+                precision=precision
+            )[0]
+        payouts = np.maximum(averages - strike, 0)*discount
+        # the expected average of the asset is known exactly from its risk neutral drift
+        average_mean = S*np.average(np.exp((r - div)*np.cumsum(_time_steps(dt, T))[columns]))
+        return self.estimate(
+            payouts, averages*discount, average_mean*discount, variance_reduction, sampling, replications
+        )
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64",
+        fixings=None, average=None, past_fixings=0
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks, precision,
+                fixings, average, past_fixings
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction, sampling,
+                replications, rng, greeks, precision, fixings, average, past_fixings
+            )
 
 
-class MonteCarloAsianPut:
+class MonteCarloAsianPut(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(np.average(GBM.simulated_path) <= strike):
-                payouts.append((strike - np.average(GBM.simulated_path))*np.exp(-r*T))
-            else:
-                payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(np.average(SVM.simulated_path) <= strike):
-                payouts.append((strike - np.average(SVM.simulated_path))*np.exp(-r*T))
+    # fixings: future fixing times (every step of the grid by default), average: average of the past_fixings fixings
+    # already made. Prices come from the streaming engines, paths are only simulated (on the fixing dates under
+    # geometric Brownian motion) when greeks are asked for
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, variance_reduction=None, sampling="pseudo", replications=16, rng=None,
+        greeks=False, precision="float64", fixings=None, average=None, past_fixings=0
+            ):
+        fixings = _fixing_times(fixings, dt, T)
+        weight, strike = _partial_average(strike, fixings, average, past_fixings)
+        discount = weight*np.exp(-r*T)
+        if greeks:
+            steps = _observation_steps(fixings, T)
+            columns = _fixing_columns(fixings, steps)
+            paths = GeometricBrownianMotion.simulate_paths(
+                S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, rng=rng, precision=precision, times=fixings
+            )
+
+            def payoff(paths, S, variance):
+                return np.maximum(strike - np.mean(paths[:, columns], axis=1, dtype=float), 0)*discount
+
+            self.path_greeks(
+                greeks, "pathwise", payoff, paths, sigma*sigma, S, variance_reduction, sampling, replications,
+                gbm=(mu, sigma, steps)
+            )
+            arithmetic = np.mean(paths[:, columns], axis=1, dtype=float)
+            geometric = np.exp(np.mean(np.log(paths[:, columns]), axis=1, dtype=float))
+        else:
+            arithmetic, geometric = GeometricBrownianMotion.simulate_averages(
+                S, mu, sigma, fixings, n, rng=rng, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, precision=precision
+            )
+        payouts = np.maximum(strike - arithmetic, 0)*discount
+        control = control_mean = None
+        if "control_variate" in _variance_reduction_modes(variance_reduction):
+            if strike > 0:
+                # the geometric-average Asian has a closed form and is highly correlated with the arithmetic one
+                control = np.maximum(strike - geometric, 0)*discount
+                control_mean = weight*GeometricAsianOption(
+                    S, sigma, strike, fixings, r, "PUT", drift=mu
+                ).price*np.exp(-r*(T - fixings[-1]))
             else:
-                payouts.append(0)
-        return np.average(payouts)
+                # past fixings already decide the option, the average itself is the control
+                control = arithmetic*discount
+                control_mean = S*np.average(np.exp(mu*fixings))*discount
+        return self.estimate(payouts, control, control_mean, variance_reduction, sampling, replications)
+
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64", fixings=None, average=None,
+        past_fixings=0
+            ):
+        fixings = _fixing_times(fixings, dt, T)
+        weight, strike = _partial_average(strike, fixings, average, past_fixings)
+        discount = weight*np.exp(-r*T)
+        columns = _fixing_columns(fixings, _time_steps(dt, T))
+        if greeks:
+            state = _random_state(rng)
+            paths = StochasticVarianceModel.simulate_paths(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+                sampling=sampling, replications=replications, rng=rng, precision=precision
+            )
+            averages = np.mean(paths[:, columns], axis=1, dtype=float)
+
+            def payoff(paths, S, variance):
+                return np.maximum(strike - np.mean(paths[:, columns], axis=1, dtype=float), 0)*discount
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+            self.path_greeks(
+                greeks, "pathwise", payoff, paths, None, S, variance_reduction, sampling, replications,
+                svm=(rng, state, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n)
+            )
+        else:
+            averages = StochasticVarianceModel.simulate_averages(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, fixings, n, rng=rng,
+                variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+                precision=precision
+            )[0]
+        payouts = np.maximum(strike - averages, 0)*discount
+        # the expected average of the asset is known exactly from its risk neutral drift
+        average_mean = S*np.average(np.exp((r - div)*np.cumsum(_time_steps(dt, T))[columns]))
+        return self.estimate(
+            payouts, averages*discount, average_mean*discount, variance_reduction, sampling, replications
+        )
+
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, greeks=False, precision="float64",
+        fixings=None, average=None, past_fixings=0
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T)
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, variance_reduction, sampling, replications, rng, greeks, precision,
+                fixings, average, past_fixings
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, variance_reduction, sampling,
+                replications, rng, greeks, precision, fixings, average, past_fixings
+            )
 
 
-class MonteCarloExtendibleCall:
+class MonteCarloExtendibleCall(MonteCarloPricer):
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T, extension):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] >= strike):
-                payouts.append((GBM.simulated_path[-1] - strike)*np.exp(-r*T))
-            else:
-                GBM2 = GeometricBrownianMotion(GBM.simulated_path[-1], mu, sigma, dt, extension)  # Continue the simulation
-                if(GBM2.simulated_path[-1] >= strike):
-                    payouts.append((GBM2.simulated_path[-1] - strike)*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] >= strike):
-                payouts.append((SVM.simulated_path[-1] - strike)*np.exp(-r*T))
-            else:
-                SVM2 = StochasticVarianceModel(SVM.simulated_path[-1], mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)  # Continue the simulation
-                if(SVM2.simulated_path[-1] >= strike):
-                    payouts.append((SVM2.simulated_path[-1] - strike)*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-        return np.average(payouts)
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, extension, variance_reduction=None, sampling="pseudo", replications=16,
+        rng=None, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+        control = terminal*np.exp(-r*T)
+        # Continue the simulation only for the paths that finish out of the money, in one batch from their terminal price
+        extend = np.flatnonzero(~(terminal >= strike))
+        instrumentation.count("extended_paths", len(extend))
+        if len(extend):
+            terminal[extend] = GeometricBrownianMotion.simulate_paths(
+                terminal[extend], mu, sigma, dt, extension, len(extend), rng=rng, precision=precision,
+                times=[extension]
+            )[:, -1]
+        # extended paths pay at the extended expiry
+        discount = np.full(len(terminal), np.exp(-r*T))
+        discount[extend] = np.exp(-r*(T + extension))
+        payouts = np.maximum(terminal - strike, 0)*discount
+        return self.estimate(payouts, control, S*np.exp((mu - r)*T), variance_reduction, sampling, replications)
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, extension, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
+        paths, variances = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, return_variance=True,
+            variance_reduction=variance_reduction, sampling=sampling, replications=replications, rng=rng,
+            precision=precision
+        )
+        terminal = paths[:, -1].copy()
+        control = terminal*np.exp(-r*T)
+        # Continue the simulation only for the paths that finish out of the money, in one batch from their terminal
+        # price and variance
+        extend = np.flatnonzero(~(terminal >= strike))
+        instrumentation.count("extended_paths", len(extend))
+        if len(extend):
+            terminal[extend] = StochasticVarianceModel.simulate_paths(
+                terminal[extend], mu, r, div, alpha, beta, rho, vol_var, variances[extend, -1], dt, extension,
+                len(extend), rng=rng, precision=precision
+            )[:, -1]
+        # extended paths pay at the extended expiry
+        discount = np.full(len(terminal), np.exp(-r*T))
+        discount[extend] = np.exp(-r*(T + extension))
+        payouts = np.maximum(terminal - strike, 0)*discount
+        return self.estimate(payouts, control, S*np.exp(-div*T), variance_reduction, sampling, replications)
+
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, extension, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T, extension)
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, extension, variance_reduction, sampling, replications, rng,
+                precision
+            )
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension, variance_reduction,
+                sampling, replications, rng, precision
+            )
+
+
+class MonteCarloExtendiblePut(MonteCarloPricer):
+
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, extension, variance_reduction=None, sampling="pseudo", replications=16,
+        rng=None, precision="float64"
+            ):
+        terminal = GeometricBrownianMotion.simulate_paths(
+            S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling, replications=replications,
+            rng=rng, precision=precision, times=[T]
+        )[:, -1]
+        control = terminal*np.exp(-r*T)
+        # Continue the simulation only for the paths that finish out of the money, in one batch from their terminal price
+        extend = np.flatnonzero(~(terminal <= strike))
+        instrumentation.count("extended_paths", len(extend))
+        if len(extend):
+            terminal[extend] = GeometricBrownianMotion.simulate_paths(
+                terminal[extend], mu, sigma, dt, extension, len(extend), rng=rng, precision=precision,
+                times=[extension]
+            )[:, -1]
+        # extended paths pay at the extended expiry
+        discount = np.full(len(terminal), np.exp(-r*T))
+        discount[extend] = np.exp(-r*(T + extension))
+        payouts = np.maximum(strike - terminal, 0)*discount
+        return self.estimate(payouts, control, S*np.exp((mu - r)*T), variance_reduction, sampling, replications)
+
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
+        paths, variances = StochasticVarianceModel.simulate_paths(
+            S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, return_variance=True,
+            variance_reduction=variance_reduction, sampling=sampling, replications=replications, rng=rng,
+            precision=precision
+        )
+        terminal = paths[:, -1].copy()
+        control = terminal*np.exp(-r*T)
+        # Continue the simulation only for the paths that finish out of the money, in one batch from their terminal
+        # price and variance
+        extend = np.flatnonzero(~(terminal <= strike))
+        instrumentation.count("extended_paths", len(extend))
+        if len(extend):
+            terminal[extend] = StochasticVarianceModel.simulate_paths(
+                terminal[extend], mu, r, div, alpha, beta, rho, vol_var, variances[extend, -1], dt, extension,
+                len(extend), rng=rng, precision=precision
+            )[:, -1]
+        # extended paths pay at the extended expiry
+        discount = np.full(len(terminal), np.exp(-r*T))
+        discount[extend] = np.exp(-r*(T + extension))
+        payouts = np.maximum(strike - terminal, 0)*discount
+        return self.estimate(payouts, control, S*np.exp(-div*T), variance_reduction, sampling, replications)
+
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, extension, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
+        if alpha is None:
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, extension, variance_reduction, sampling, replications, rng,
+                precision
+            )
+        else:
+            inst_var = np.sqrt(sigma)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension, variance_reduction,
+                sampling, replications, rng, precision
+            )
+
+
+# Exercise times of a Bermudan option with expiry included, every step of the simulation grid when none are given
+def _exercise_times(exercise_dates, dt, T):
+    if exercise_dates is None:
+        return np.cumsum(_time_steps(dt, T))
+    times = np.asarray(exercise_dates, dtype=float).ravel()
+    if np.any(times <= 0) or np.any(times > T + 1e-12):
+        raise ValueError("Exercise dates must be times in (0, T]")
+    return np.unique(np.append(times, T))
+
+
+# Regression basis of the continuation value in the spot over the strike x (and the variance v when given): powers
+# of x for "polynomial", a constant and the weighted Laguerre polynomials exp(-x/2) L_k(x) for "laguerre", degree
+# terms beyond the constant either way, with v, v^2 and x v appended for the variance
+def _exercise_basis(x, v, basis, degree):
+    if basis == "polynomial":
+        columns = [np.ones_like(x)]
+        for k in range(degree):
+            columns.append(columns[-1]*x)
+    else:
+        weight = np.exp(-.5*x)
+        laguerre = [np.ones_like(x), 1 - x]
+        for k in range(1, degree - 1):
+            laguerre.append(((2*k + 1 - x)*laguerre[k] - k*laguerre[k - 1])/(k + 1))
+        columns = [np.ones_like(x)] + [weight*polynomial for polynomial in laguerre[:degree]]
+    if v is not None:
+        columns += [v, v*v, x*v]
+    return np.column_stack(columns)
 
 
-class MonteCarloExtendiblePut:
+# Longstaff-Schwartz backward induction over the exercise dates (columns of payoffs, states and variances at times):
+# from the last date but one back, the discounted cash flows of the paths in the money are regressed on the basis
+# and those whose payoff beats the fitted continuation value exercise. Returns the cash flows discounted to today
+# and the coefficients of every date (None where too few paths were in the money to regress)
+def _longstaff_schwartz(payoffs, states, variances, times, r, basis, degree):
+    dates = payoffs.shape[1]
+    cash = payoffs[:, -1].copy()
+    coefficients = [None]*dates
+    for k in range(dates - 2, -1, -1):
+        cash *= np.exp(-r*(times[k + 1] - times[k]))
+        itm = np.flatnonzero(payoffs[:, k] > 0)
+        X = _exercise_basis(states[itm, k], None if variances is None else variances[itm, k], basis, degree)
+        if len(itm) <= X.shape[1]:
+            continue
+        coefficients[k] = np.linalg.lstsq(X, cash[itm], rcond=None)[0]
+        exercise = itm[payoffs[itm, k] > X @ coefficients[k]]
+        cash[exercise] = payoffs[exercise, k]
+    return cash*np.exp(-r*times[0]), coefficients
 
-    def simulate_price_gbm(self, strike, n, r, S, mu, sigma, dt, T, extension):
-        payouts = []
-        for i in range(0, n):
-            GBM = GeometricBrownianMotion(S, mu, sigma, dt, T)
-            if(GBM.simulated_path[-1] <= strike):
-                payouts.append((strike - GBM.simulated_path[-1])*np.exp(-r*T))
+
+# Cash flows discounted to today of paths exercised by fitted coefficients, at the first date where the option is in
+# the money and its payoff beats the continuation value, at expiry otherwise
+def _exercise_by(payoffs, states, variances, times, r, basis, degree, coefficients):
+    cash = payoffs[:, -1]*np.exp(-r*times[-1])
+    alive = np.ones(len(cash), dtype=bool)
+    for k in range(payoffs.shape[1] - 1):
+        if coefficients[k] is None:
+            continue
+        candidates = np.flatnonzero(alive & (payoffs[:, k] > 0))
+        X = _exercise_basis(
+            states[candidates, k], None if variances is None else variances[candidates, k], basis, degree
+        )
+        exercise = candidates[payoffs[candidates, k] > X @ coefficients[k]]
+        cash[exercise] = payoffs[exercise, k]*np.exp(-r*times[k])
+        alive[exercise] = False
+    return cash
+
+
+# Bermudan and American options by least squares Monte Carlo (Longstaff-Schwartz) on the path matrix. The exercise
+# rule is fitted on n paths, with out_of_sample it is then applied to n independent paths whose price is biased low
+# (a fitted rule can only be suboptimal) while the in sample price, kept as in_sample_price, tends to be biased high
+class _MonteCarloLeastSquares(MonteCarloPricer):
+
+    def payoff(self, prices, strike):
+        pass
+
+    # simulate() returns the prices (and variances or None) of n paths on the exercise dates
+    def least_squares_price(
+        self, simulate, strike, times, r, T, basis, degree, out_of_sample, control_mean, variance_reduction, sampling,
+        replications
+            ):
+        if basis not in EXERCISE_BASES:
+            raise ValueError("Basis must be one of " + ", ".join(EXERCISE_BASES))
+        prices, variances = simulate()
+        with instrumentation.stage("regression"):
+            prices = np.asarray(prices, dtype=float)
+            variances = None if variances is None else np.asarray(variances, dtype=float)
+            cash, coefficients = _longstaff_schwartz(
+                self.payoff(prices, strike), prices/strike, variances, times, r, basis, degree
+            )
+        self.in_sample_price = np.average(cash)
+        self.coefficients = coefficients
+        if out_of_sample:
+            prices, variances = simulate()
+            with instrumentation.stage("regression"):
+                prices = np.asarray(prices, dtype=float)
+                variances = None if variances is None else np.asarray(variances, dtype=float)
+                cash = _exercise_by(
+                    self.payoff(prices, strike), prices/strike, variances, times, r, basis, degree, coefficients
+                )
+        # the discounted terminal asset is the control variate, as for the European pricers
+        return self.estimate(cash, prices[:, -1]*np.exp(-r*T), control_mean, variance_reduction, sampling, replications)
+
+    # exercise_dates: times the option may be exercised besides expiry (every step of the dt grid when None, which
+    # approximates American exercise), under geometric Brownian motion only those dates are simulated
+    def simulate_price_gbm(
+        self, strike, n, r, S, mu, sigma, dt, T, exercise_dates=None, basis="laguerre", degree=3, out_of_sample=True,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
+        times = _exercise_times(exercise_dates, dt, T)
+
+        def simulate():
+            return GeometricBrownianMotion.simulate_paths(
+                S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, rng=rng, precision=precision, times=times
+            ), None
+        return self.least_squares_price(
+            simulate, strike, times, r, T, basis, degree, out_of_sample, S*np.exp((mu - r)*T), variance_reduction,
+            sampling, replications
+        )
+
+    # variance_basis: regress on the variance state too, exercise dates fall on the first grid point at or after them
+    def simulate_price_svm(
+        self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, exercise_dates=None,
+        basis="laguerre", degree=3, variance_basis=True, out_of_sample=True, variance_reduction=None, sampling="pseudo",
+        replications=16, rng=None, precision="float64"
+            ):
+        steps = _time_steps(dt, T)
+        columns = np.unique(_fixing_columns(_exercise_times(exercise_dates, dt, T), steps))
+
+        def simulate():
+            paths, variances = StochasticVarianceModel.simulate_paths(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, return_variance=True,
+                variance_reduction=variance_reduction, sampling=sampling, replications=replications, rng=rng,
+                precision=precision
+            )
+            return paths[:, columns], variances[:, columns] if variance_basis else None
+        return self.least_squares_price(
+            simulate, strike, np.cumsum(steps)[columns], r, T, basis, degree, out_of_sample, S*np.exp(-div*T),
+            variance_reduction, sampling, replications
+        )
+
+    def __init__(
+        self, strike, n, r, S, mu, sigma, dt, T, exercise_dates=None, alpha=None, beta=None, rho=None, div=None,
+        vol_var=None, basis="laguerre", degree=3, variance_basis=True, out_of_sample=True, variance_reduction=None,
+        sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
+        if alpha is None:
+            self.price = self.simulate_price_gbm(
+                strike, n, r, S, mu, sigma, dt, T, exercise_dates, basis, degree, out_of_sample, variance_reduction,
+                sampling, replications, rng, precision
+            )
+        else:
+            inst_var = np.sqrt(sigma)
+            self.price = self.simulate_price_svm(
+                strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, exercise_dates, basis, degree,
+                variance_basis, out_of_sample, variance_reduction, sampling, replications, rng, precision
+            )
+
+
+class MonteCarloAmericanCall(_MonteCarloLeastSquares):
+
+    def payoff(self, prices, strike):
+        return np.maximum(prices - strike, 0)
+
+
+class MonteCarloAmericanPut(_MonteCarloLeastSquares):
+
+    def payoff(self, prices, strike):
+        return np.maximum(strike - prices, 0)
+
+
+# Simulate once, price many: every registered payoff is evaluated against one shared path matrix
+class MonteCarloPayoffBook(MonteCarloPricer):
+
+    PAYOFF_TYPES = (
+        "CALL", "PUT", "BINARY_CALL", "BINARY_PUT", "ASIAN_CALL", "ASIAN_PUT", "BARRIER_CALL", "BARRIER_PUT"
+    )
+
+    # Register a payoff definition and return its index in the book
+    def add(self, payoff_type, strike, payout=1, barrier=None, up=True, out=True):
+        if payoff_type not in self.PAYOFF_TYPES:
+            raise ValueError("Payoff type must be one of " + ", ".join(self.PAYOFF_TYPES))
+        if payoff_type.startswith("BARRIER") and barrier is None:
+            raise ValueError("Barrier payoffs require a barrier level")
+        self.payoffs.append((payoff_type, strike, payout, barrier, up, out))
+        return len(self.payoffs) - 1
+
+    # Discounted payouts of every payoff on every path as an (n, payoffs) matrix
+    def evaluate(self, paths, r, T):
+        payouts = np.zeros((paths.shape[0], len(self.payoffs)))
+        terminal = paths[:, -1:]
+        average = None
+        path_max = path_min = None
+        for payoff_type in self.PAYOFF_TYPES:
+            index = [i for i, p in enumerate(self.payoffs) if p[0] == payoff_type]
+            if not index:
+                continue
+            strike, payout, barrier, up, out = (np.array([self.payoffs[i][j] for i in index]) for j in range(1, 6))
+            if payoff_type.startswith("ASIAN"):
+                if average is None:
+                    average = np.mean(paths, axis=1, dtype=float)[:, None]
+                underlying = average
             else:
-                GBM2 = GeometricBrownianMotion(GBM.simulated_path[-1], mu, sigma, dt, extension)  # Continue the simulation
-                if(GBM2.simulated_path[-1] <= strike):
-                    payouts.append((strike - GBM2.simulated_path[-1])*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-        return np.average(payouts)
-
-    def simulate_price_svm(self, strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension):
-        payouts = []
-        for i in range(0, n):
-            SVM = StochasticVarianceModel(S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)
-            if(SVM.simulated_path[-1] <= strike):
-                payouts.append((strike - SVM.simulated_path[-1])*np.exp(-r*T))
+                underlying = terminal
+            if payoff_type.endswith("CALL"):
+                intrinsic = underlying - strike
             else:
-                SVM2 = StochasticVarianceModel(SVM.simulated_path[-1], mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T)  # Continue the simulation
-                if(SVM2.simulated_path[-1] <= strike):
-                    payouts.append((strike - SVM2.simulated_path[-1])*np.exp(-r*T))
-                else:
-                    payouts.append(0)
-        return np.average(payouts)
+                intrinsic = strike - underlying
+            if payoff_type.startswith("BINARY"):
+                values = np.where(intrinsic >= 0, payout, 0.)
+            else:
+                values = np.maximum(intrinsic, 0)
+            if payoff_type.startswith("BARRIER"):
+                if path_max is None:
+                    path_max = paths.max(axis=1)[:, None]
+                    path_min = paths.min(axis=1)[:, None]
+                barrier_triggered = np.where(up, path_max >= barrier, path_min <= barrier)
+                values = np.where(barrier_triggered != out, values, 0.)
+            payouts[:, index] = values
+        return payouts*np.exp(-r*T)
 
-    def __init__(self, strike, n, r, S, mu, sigma, dt, T, extension, alpha=None, beta=None, rho=None, div=None, vol_var=None):
+    # Variance reduction applies to every payoff in the book, the discounted terminal asset is the shared control variate
+    def price(
+        self, n, r, S, mu, sigma, dt, T, alpha=None, beta=None, rho=None, div=None, vol_var=None,
+        variance_reduction=None, sampling="pseudo", replications=16, rng=None, precision="float64"
+            ):
         if alpha is None:
-            self.price = self.simulate_price_gbm(strike, n, r, S, mu, sigma, dt, T, extension)
+            # a book of European payoffs only needs the terminal price
+            times = [T] if all(p[0] in ("CALL", "PUT", "BINARY_CALL", "BINARY_PUT") for p in self.payoffs) else None
+            paths = GeometricBrownianMotion.simulate_paths(
+                S, mu, sigma, dt, T, n, variance_reduction=variance_reduction, sampling=sampling,
+                replications=replications, rng=rng, precision=precision, times=times
+            )
+            control_mean = S*np.exp((mu - r)*T)
         else:
             inst_var = np.sqrt(sigma)
-            self.price = self.simulate_price_svm(strike, n, S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, extension)
+            paths = StochasticVarianceModel.simulate_paths(
+                S, mu, r, div, alpha, beta, rho, vol_var, inst_var, dt, T, n, variance_reduction=variance_reduction,
+                sampling=sampling, replications=replications, rng=rng, precision=precision
+            )
+            control_mean = S*np.exp(-div*T)
+        payouts = self.evaluate(paths, r, T)
+        self.prices = self.estimate(
+            payouts, paths[:, -1]*np.exp(-r*T), control_mean, variance_reduction, sampling, replications
+        )
+        self.standard_errors = self.standard_error
+        return self.prices, self.standard_errors
+
+    # Prices the book on given paths, such as a memory-mapped Scenario, chunk_size rows at a time so only one chunk of
+    # payouts is in memory. forward is the expected terminal price, which makes the discounted terminal price a
+    # control variate
+    def price_paths(self, paths, r, T, forward=None, variance_reduction=None, chunk_size=65536):
+        modes = _variance_reduction_modes(variance_reduction)
+        expected_control = forward*np.exp(-r*T) if forward is not None and "control_variate" in modes else None
+        self.accumulator = MonteCarloAccumulator(expected_control)
+        for start in range(0, len(paths), chunk_size):
+            chunk = np.asarray(paths[start:start + chunk_size])
+            self.accumulator.add(self.evaluate(chunk, r, T), chunk[:, -1]*np.exp(-r*T))
+        self.prices = self.accumulator.price
+        self.standard_errors = self.standard_error = self.accumulator.standard_error
+        self.variance_reduction_factor = self.accumulator.variance_reduction_factor
+        return self.prices, self.standard_errors
+
+    def __init__(self):
+        self.payoffs = []
+        self.prices = None
+        self.standard_errors = None
+
+
+# Prices one chunk of paths from its own random stream and returns the chunk's partial statistics
+def _price_chunk(task):
+    pricer, args, kwargs, seed_sequence = task
+    return pricer(*args, rng=np.random.Generator(np.random.PCG64(seed_sequence)), **kwargs).accumulator
+
+
+# Runs any MonteCarlo pricer over a process pool: MonteCarloParallel(MonteCarloBarrierCall, strike, n, barrier, ...)
+# takes the pricer's own arguments, n is split into fixed-size chunks and chunk i always draws from the i-th stream
+# spawned from SeedSequence(seed). Partial statistics are merged in chunk order so the result for a seed is
+# bit-identical whatever the number of workers
+class MonteCarloParallel:
+
+    def __init__(self, pricer, *args, seed=None, workers=None, chunk_size=65536, **kwargs):
+        args = list(args)
+        n = args[1]
+        self.seed_sequence = np.random.SeedSequence(seed)
+        sizes = [chunk_size]*(n//chunk_size) + ([n % chunk_size] if n % chunk_size else [])
+        tasks = [
+            (pricer, args[:1] + [size] + args[2:], kwargs, stream)
+            for size, stream in zip(sizes, self.seed_sequence.spawn(len(sizes)))
+        ]
+        workers = min(workers or os.cpu_count(), len(tasks))
+        if workers > 1:
+            # the process pool machinery is only loaded here
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = list(pool.map(_price_chunk, tasks))
+        else:
+            chunks = [_price_chunk(task) for task in tasks]
+        self.accumulator = MonteCarloAccumulator(chunks[0].expected_control)
+        for chunk in chunks:
+            self.accumulator.merge(chunk)
+        self.price = self.accumulator.price
+        self.standard_error = self.accumulator.standard_error
+        self.variance_reduction_factor = self.accumulator.variance_reduction_factor
+
+
+# Streams a MonteCarlo pricer in fixed-size chunks folded into one running accumulator, memory stays that of a single
+# chunk. MonteCarloStream(MonteCarloCall, strike, n, ...) takes the pricer's own arguments with n as the most paths
+# to run, and stops early once the standard error reaches absolute_error or relative_error (as a fraction of the
+# price) or time_budget seconds have elapsed. callback(accumulator) is called after every chunk for live price,
+# standard error and confidence interval. Chunk i uses the same stream as chunk i of MonteCarloParallel
+class MonteCarloStream:
+
+    def __init__(
+        self, pricer, *args, seed=None, chunk_size=8192, absolute_error=None, relative_error=None, time_budget=None,
+        callback=None, **kwargs
+            ):
+        args = list(args)
+        n = args[1]
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.accumulator = None
+        self.stopped_by = "n"
+        start = time.perf_counter()
+        paths = 0
+        while paths < n:
+            size = min(chunk_size, n - paths)
+            chunk = _price_chunk((pricer, args[:1] + [size] + args[2:], kwargs, self.seed_sequence.spawn(1)[0]))
+            if self.accumulator is None:
+                self.accumulator = MonteCarloAccumulator(chunk.expected_control)
+            self.accumulator.merge(chunk)
+            paths += size
+            if callback is not None:
+                callback(self.accumulator)
+            error = np.max(self.accumulator.standard_error)
+            if absolute_error is not None and error <= absolute_error:
+                self.stopped_by = "absolute_error"
+                break
+            if relative_error is not None and np.all(
+                self.accumulator.standard_error <= relative_error*np.abs(self.accumulator.price)
+            ):
+                self.stopped_by = "relative_error"
+                break
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                self.stopped_by = "time_budget"
+                break
+        self.paths = paths
+        self.price = self.accumulator.price
+        self.standard_error = self.accumulator.standard_error
+        self.confidence_interval = self.accumulator.confidence_interval()
@@ -1,12 +1,14 @@
 from abc import ABC, abstractmethod
-from scipy.stats import norm
 import numpy as np
+from . import normal
+from .options import BlackScholesChain
+from .simulations import StochasticVarianceModel, _sobol_points, _standard_normals, _time_steps
 
 # Abstract class framework for a stochastic process
 class StochasticModel:
 
     @abstractmethod
-    # Risk neutral pricing kernel
+    # Risk neutral pricing kernel, F0, X and T broadcast against each other
     def vanilla_pricing(self, F0, X, T, op_type="CALL"):
         pass
 
@@ -14,11 +16,31 @@ class StochasticModel:
     def calibrate(self, impl_vol, T, op_type="CALL"):
         pass
 
-    # simulation is conducted after calibration of params to price exotics
+    # Fills paths[:, 1:] in place from the starting values in paths[:, 0], steps is the time grid spacing
     @abstractmethod
-    def simulate(self):
+    def diffuse(self, paths, steps, rng=None, sampling="pseudo", replications=16):
         pass
 
+    # Simulation times of the paths, fixed by dt and T: 0, dt, 2dt, ... with the last step shortened to end at T
+    @staticmethod
+    def time_grid(dt, T):
+        return np.concatenate(([0.], np.cumsum(_time_steps(dt, T))))
+
+    # simulation is conducted after calibration of params to price exotics
+    # returns a preallocated (n, steps + 1) array on time_grid(dt, T) starting at F0, rng is a numpy Generator (the
+    # global state when None) and keep=False does not store the paths on path_characteristics
+    def simulate(self, F0, n, dt, T, sampling="pseudo", replications=16, rng=None, keep=True):
+        steps = _time_steps(dt, T)
+        if sampling == "sobol":
+            # Sobol replications split the paths evenly, a power of two points each
+            n = _sobol_points(n, replications)*replications
+        paths = np.empty((n, len(steps) + 1))
+        paths[:, 0] = F0
+        self.diffuse(paths, steps, rng, sampling, replications)
+        if keep:
+            self.path_characteristics = (paths, n, dt, T)
+        return paths
+
     def __init__(self, params) -> None:
         self.params = params
 
@@ -27,38 +49,142 @@ class ArithmeticBrownianMotion(StochasticModel):
 
     # closed form vanilla euro option pricing
     def vanilla_pricing(self, F0, X, T, op_type="CALL"):
+        F0, X, T = np.asarray(F0, dtype=float), np.asarray(X, dtype=float), np.asarray(T, dtype=float)
         # return closed-form Bachelier call
         if op_type == "CALL":
-            return (F0 - X)*(norm.cdf((F0 - X)/(self.params[0]*np.sqrt(T)))) + self.params[0]*np.sqrt(T)*(norm.pdf((F0 - X)/(self.params[0]*np.sqrt(T))))
+            return (F0 - X)*(normal.cdf((F0 - X)/(self.params[0]*np.sqrt(T)))) + self.params[0]*np.sqrt(T)*(normal.pdf((F0 - X)/(self.params[0]*np.sqrt(T))))
         # use call-put parity for put price
         elif op_type == "PUT":
             return self.vanilla_pricing(F0, X, T) - F0 + X
         else:
             return "Option type must be CALL/PUT"
         
-    # simulating paths of arithmetic Brownian motion
-    def simulate(self, F0, n, dt, T):
-        paths = []
-        for i in range(n):
-            # n simulations
-            ttm = T
-            path = [F0]
-            # while the step is greator than zero diffuse the process
-            while ttm-dt > 0:
-                path.append(path[-1] + self.params[0]*np.random.randn()*np.sqrt(dt))
-                ttm -= dt
-            # final time increment
-            if dt > 0:
-                path.append(path[-1] + self.params[0]*np.random.randn()*np.sqrt(dt))
-            # append the path
-            paths.append(path)
-
-        # store paths and path characteristics
-        self.path_characteristics = (paths, n, dt, T)
-
-        # return paths and path characteristics
-        return (paths, n, dt, T)
+    # arithmetic Brownian motion increments, sampling="sobol" drives the paths with scrambled Sobol points and a
+    # Brownian bridge (see simulations.py)
+    def diffuse(self, paths, steps, rng=None, sampling="pseudo", replications=16):
+        increments = _standard_normals(rng, (len(paths), len(steps)), sampling=sampling, replications=replications, steps=steps)
+        increments *= self.params[0]*np.sqrt(steps)
+        np.cumsum(increments, axis=1, out=paths[:, 1:])
+        paths[:, 1:] += paths[:, :1]
 
     # Calibration cannot be conducted due to flat volatility surface
     def __init__(self, params) -> None:
-        super().__init__(params)
\ No newline at end of file
+        super().__init__(params)
+
+
+class HestonModel(StochasticModel):
+
+    # params: [alpha, beta, rho, vol_var, inst_var] - mean reversion rate, long run variance, correlation,
+    # variance's volatility and initial variance, as in StochasticVarianceModel
+    PARAMETER_BOUNDS = ([1e-3, 1e-4, -.999, 1e-3, 1e-4], [20., 4., .999, 5., 4.])
+    COS_TERMS = 256
+    COS_RANGE = 20
+
+    # characteristic function of ln(F_T/F0) at frequencies u (expiries along the first axis, shape (expiries, terms))
+    # in the formulation that avoids the branch cut of the complex logarithm
+    def characteristic_function(self, u, T, params=None):
+        alpha, beta, rho, vol_var, inst_var = self.params if params is None else params
+        T = np.reshape(T, (-1, 1))
+        iu = 1j*u
+        a = alpha - rho*vol_var*iu
+        d = np.sqrt(a*a + vol_var*vol_var*(iu + u*u))
+        g = (a - d)/(a + d)
+        e = np.exp(-d*T)
+        C = alpha*beta/vol_var**2*((a - d)*T - 2*np.log((1 - g*e)/(1 - g)))
+        D = (a - d)/vol_var**2*(1 - e)/(1 - g*e)
+        return np.exp(C + D*inst_var)
+
+    # COS truncation range of ln(F_T/F0) from its first two cumulants (Fang & Oosterlee), wider than their L = 12
+    # since the exponential tails of the model are heavy for a large variance's volatility
+    def cos_range(self, T, params=None):
+        alpha, beta, rho, vol_var, inst_var = self.params if params is None else params
+        e = np.exp(-alpha*T)
+        c1 = (1 - e)*(beta - inst_var)/(2*alpha) - .5*beta*T
+        c2 = (
+            vol_var*T*alpha*e*(inst_var - beta)*(8*alpha*rho - 4*vol_var)
+            + alpha*rho*vol_var*(1 - e)*(16*beta - 8*inst_var)
+            + 2*beta*alpha*T*(-4*alpha*rho*vol_var + vol_var**2 + 4*alpha**2)
+            + vol_var**2*((beta - 2*inst_var)*e*e + beta*(6*e - 7) + 2*inst_var)
+            + 8*alpha**2*(inst_var - beta)*(1 - e)
+        )/(8*alpha**3)
+        width = self.COS_RANGE*np.sqrt(np.abs(c2))
+        return c1 - width, c1 + width
+
+    # Strike dependent COS terms for every expiry: the frequencies and the weights that turn characteristic function
+    # values into put prices. They depend only on the quotes and the truncation range, so calibration builds them once
+    def cos_terms(self, F0, X, T, params=None):
+        F0, X, T = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (F0, X, T)))
+        k = np.arange(self.COS_TERMS)
+        terms = []
+        for expiry in np.unique(T):
+            index = T == expiry
+            x = np.log(F0[index]/X[index])
+            lower, upper = self.cos_range(expiry, params)
+            # ln(F_T/X) = x + ln(F_T/F0), one range covers every strike of the expiry
+            a, b = lower + x.min(), upper + x.max()
+            u = k*np.pi/(b - a)
+            # put payoff X(1 - e^y) on [a, 0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                psi = np.where(k == 0, -a, np.sin(-u*a)/u)
+            chi = (np.cos(-u*a) - np.exp(a) + u*np.sin(-u*a))/(1 + u*u)
+            V = 2/(b - a)*(psi - chi)
+            V[0] *= .5
+            weights = V[:, None]*np.exp(1j*np.outer(u, x - a))*X[index]
+            terms.append((index, expiry, u, weights))
+        return F0.shape, terms
+
+    def cos_pricing(self, F0, X, T, terms, op_type="CALL", params=None):
+        F0, X = np.asarray(F0, dtype=float), np.asarray(X, dtype=float)
+        shape, terms = terms
+        prices = np.empty(shape)
+        for index, expiry, u, weights in terms:
+            prices[index] = np.real(self.characteristic_function(u, expiry, params)[0] @ weights)
+        if op_type == "CALL":
+            # put-call parity, the put expansion is the numerically stable one
+            return (prices + F0 - X)[()]
+        elif op_type == "PUT":
+            return prices[()]
+        else:
+            return "Option type must be CALL/PUT"
+
+    # semi-analytic forward (undiscounted) vanilla prices by the COS method, F0, X and T broadcast together
+    # and every strike of an expiry is priced from one characteristic function evaluation
+    def vanilla_pricing(self, F0, X, T, op_type="CALL"):
+        return self.cos_pricing(F0, X, T, self.cos_terms(F0, X, T), op_type)
+
+    # Fits the params to an implied volatility surface, impl_vol broadcasts against forwards F0, strikes X and
+    # expiries T. Price residuals are divided by the Black vega of each quote so the fit is in volatility terms
+    # without inverting model prices, the COS terms are built once from the starting params
+    def calibrate(self, impl_vol, T, op_type="CALL", F0=None, X=None):
+        # the surface alone does not say which forward and strikes its volatilities were quoted at
+        if F0 is None or X is None:
+            raise ValueError("Calibration needs the forward F0 and the strikes X of the implied volatilities")
+        impl_vol, F0, X, T = (np.ravel(v) for v in np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (impl_vol, F0, X, T))))
+        # quotes without an implied volatility (NaN) are left out
+        valid = np.isfinite(impl_vol)
+        impl_vol, F0, X, T = impl_vol[valid], F0[valid], X[valid], T[valid]
+        quotes = BlackScholesChain(F0, impl_vol, X, T, 0, op_type)
+        # the floor keeps far out of the money quotes from amplifying pricing noise
+        vega = np.maximum(quotes.vega, 1e-4*F0)
+        # fit put prices, calls through put-call parity
+        terms = self.cos_terms(F0, X, T)
+        puts = quotes.price - (F0 - X if op_type == "CALL" else 0)
+
+        def residuals(params):
+            return (self.cos_pricing(F0, X, T, terms, "PUT", params) - puts)/vega
+
+        from scipy.optimize import least_squares
+        start = np.clip(self.params, *self.PARAMETER_BOUNDS)
+        fit = least_squares(residuals, start, bounds=self.PARAMETER_BOUNDS, x_scale="jac")
+        self.params = list(fit.x)
+        self.calibration_error = np.sqrt(np.average(fit.fun**2))
+        return self.params
+
+    # forward paths from the log-Euler scheme of StochasticVarianceModel
+    def diffuse(self, paths, steps, rng=None, sampling="pseudo", replications=16):
+        alpha, beta, rho, vol_var, inst_var = self.params
+        dt, T = steps[0], np.sum(steps)
+        paths[:, 1:] = StochasticVarianceModel.simulate_paths(paths[:, 0], 0, 0, 0, alpha, beta, rho, vol_var, inst_var, dt, T, len(paths), rng=rng, sampling=sampling, replications=replications)
+
+    def __init__(self, params) -> None:
+        super().__init__(params)
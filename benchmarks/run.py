@@ -0,0 +1,446 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+import numpy as np
+
+# Benchmark suite for the package in this checkout: every public pricer is timed over grids of path counts, time
+# steps and chain sizes, recording throughput, peak traced memory and the error against closed forms where one exists
+#
+#   python benchmarks/run.py --output after.json            run the suite (--quick for the small grid)
+#   python benchmarks/run.py compare before.json after.json compare two runs, exits 1 on a regression
+#
+# To compare commits run the suite on each checkout and compare the two files. Cases only use arguments that every
+# release has, so older trees (0.1.20) run too, a case that fails is recorded with its error instead of stopping the run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "QFin"
+
+S, K, R, SIGMA, T = 100., 100., .01, .3, 1.
+# stochastic variance parameters: alpha, beta, rho, div, vol_var
+SVM = (2., .04, -.7, 0., .3)
+
+PATHS = (1000, 10000, 100000)
+QUICK_PATHS = (1000, 10000)
+STEPS = (1/12, 1/52, 1/252)
+QUICK_STEPS = (1/52,)
+CHAINS = (10, 1000, 100000)
+QUICK_CHAINS = (10, 1000)
+
+CASES = []
+
+
+# Registers fn(modules, **params) as a benchmark over every combination of the grid, fn returns a dict with the
+# number of units processed, the unit ("paths"/"options") and optionally the price error and standard error, or a
+# check() returning them after the timed runs
+def benchmark(name, **grid):
+    def register(fn):
+        CASES.append((name, grid, fn))
+        return fn
+    return register
+
+
+# The modules are loaded from the checkout under a bare package, older package __init__ files import "qfin" and only
+# work where the filesystem ignores case
+def load():
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [os.path.join(ROOT, PACKAGE)]
+    sys.modules[PACKAGE] = sys.modules[PACKAGE.lower()] = package
+    modules = {}
+    for name in ("options", "simulations", "stochastics", "pde"):
+        try:
+            modules[name] = importlib.import_module(PACKAGE + "." + name)
+        except ImportError:
+            # a module the checkout predates, its cases fail and are recorded as such
+            continue
+    return modules
+
+
+# Closed form references, written out here so a bug in the package can't hide in its own reference
+def _cdf(x):
+    return .5*math.erfc(-x/math.sqrt(2))
+
+
+def black_scholes(S, K, T, r, sigma, op_type="CALL"):
+    d1 = (math.log(S/K) + (r + .5*sigma*sigma)*T)/(sigma*math.sqrt(T))
+    d2 = d1 - sigma*math.sqrt(T)
+    if op_type == "CALL":
+        return S*_cdf(d1) - K*math.exp(-r*T)*_cdf(d2)
+    return K*math.exp(-r*T)*_cdf(-d2) - S*_cdf(-d1)
+
+
+# The formulas BlackScholesCall and BlackScholesPut have always used (kept for compatibility): d1 leaves out the rate
+# and the put swaps N(d1) and N(d2), so they are timed and checked against these and report their distance from
+# black_scholes as legacy_error instead of an accuracy error
+def legacy_black_scholes(S, K, T, r, sigma, op_type="CALL"):
+    d1 = (math.log(S/K) + .5*sigma*sigma*T)/(sigma*math.sqrt(T))
+    d2 = d1 - sigma*math.sqrt(T)
+    if op_type == "CALL":
+        return S*_cdf(d1) - K*math.exp(-r*T)*_cdf(d2)
+    return K*math.exp(-r*T)*_cdf(d1) - S*_cdf(d2)
+
+
+def _legacy_result(units, pricer, S, K, T, r, sigma, op_type):
+    result = _result(units, "options", pricer, legacy_black_scholes(S, K, T, r, sigma, op_type))
+    result["legacy_error"] = abs(float(pricer.price) - black_scholes(S, K, T, r, sigma, op_type))
+    return result
+
+
+def binary(S, K, T, r, sigma, payout, op_type="CALL"):
+    d2 = (math.log(S/K) + (r - .5*sigma*sigma)*T)/(sigma*math.sqrt(T))
+    return payout*math.exp(-r*T)*_cdf(d2 if op_type == "CALL" else -d2)
+
+
+def bachelier(F0, X, T, sigma):
+    d = (F0 - X)/(sigma*math.sqrt(T))
+    return (F0 - X)*_cdf(d) + sigma*math.sqrt(T)*math.exp(-.5*d*d)/math.sqrt(2*math.pi)
+
+
+def _result(units, unit, pricer=None, reference=None):
+    result = {"units": units, "unit": unit}
+    if pricer is not None and reference is not None:
+        result["error"] = abs(float(pricer.price) - reference)
+        standard_error = getattr(pricer, "standard_error", None)
+        if standard_error is not None:
+            result["standard_error"] = float(standard_error)
+    return result
+
+
+@benchmark("BlackScholesCall", chain=CHAINS)
+def black_scholes_call(modules, chain):
+    strikes = np.linspace(50, 150, chain)
+    for k in strikes:
+        call = modules["options"].BlackScholesCall(S, SIGMA, k, T, R)
+        call.delta, call.gamma, call.vega, call.theta
+    return _legacy_result(chain, call, S, strikes[-1], T, R, SIGMA, "CALL")
+
+
+@benchmark("BlackScholesPut", chain=CHAINS)
+def black_scholes_put(modules, chain):
+    strikes = np.linspace(50, 150, chain)
+    for k in strikes:
+        put = modules["options"].BlackScholesPut(S, SIGMA, k, T, R)
+        put.delta, put.gamma, put.vega, put.theta
+    return _legacy_result(chain, put, S, strikes[-1], T, R, SIGMA, "PUT")
+
+
+@benchmark("GeometricBrownianMotion", n=PATHS, dt=STEPS)
+def geometric_brownian_motion(modules, n, dt):
+    model = modules["simulations"].GeometricBrownianMotion
+    if hasattr(model, "simulate_paths"):
+        model.simulate_paths(S, R, SIGMA, dt, T, n)
+    else:
+        for i in range(n):
+            model(S, R, SIGMA, dt, T)
+    return _result(n, "paths")
+
+
+@benchmark("StochasticVarianceModel", n=PATHS, dt=STEPS)
+def stochastic_variance_model(modules, n, dt):
+    model = modules["simulations"].StochasticVarianceModel
+    alpha, beta, rho, div, vol_var = SVM
+    if hasattr(model, "simulate_paths"):
+        model.simulate_paths(S, R, R, div, alpha, beta, rho, vol_var, beta, dt, T, n)
+    else:
+        for i in range(n):
+            model(S, R, R, div, alpha, beta, rho, vol_var, beta, dt, T)
+    return _result(n, "paths")
+
+
+@benchmark("ArithmeticBrownianMotion", n=PATHS, dt=STEPS)
+def arithmetic_brownian_motion(modules, n, dt):
+    model = modules["stochastics"].ArithmeticBrownianMotion([SIGMA*S])
+    paths = model.simulate(S, n, dt, T)
+    # older releases return (paths, n, dt, T)
+    if isinstance(paths, tuple):
+        paths = paths[0]
+    terminal = np.array([path[-1] for path in paths])
+    price = np.average(np.maximum(terminal - K, 0))
+    reference = bachelier(S, K, T, SIGMA*S)
+    return {"units": n, "unit": "paths", "error": abs(price - reference), "standard_error": np.std(np.maximum(terminal - K, 0))/math.sqrt(n),
+            "closed_form_error": abs(float(model.vanilla_pricing(S, K, T)) - reference)}
+
+
+# Finite difference pricers over grid sizes (twice as many spot steps as time steps), European calls against the
+# closed form and knock-out calls on a continuously monitored barrier
+@benchmark("CrankNicolsonCall", spot_steps=(100, 400, 1600), barrier=(None, 130), exercise=("european", "american"))
+def crank_nicolson_call(modules, spot_steps, barrier, exercise):
+    call = modules["pde"].CrankNicolsonCall(S, SIGMA, K, T, R, barrier=barrier, exercise=exercise, spot_steps=spot_steps, time_steps=spot_steps//2)
+    # without dividends an American call is worth its European value
+    return _result(1, "options", call, black_scholes(S, K, T, R, SIGMA) if barrier is None else None)
+
+
+@benchmark("CrankNicolsonPut", spot_steps=(100, 400, 1600), exercise=("european", "american"))
+def crank_nicolson_put(modules, spot_steps, exercise):
+    put = modules["pde"].CrankNicolsonPut(S, SIGMA, K, T, R, exercise=exercise, spot_steps=spot_steps, time_steps=spot_steps//2)
+    return _result(1, "options", put, black_scholes(S, K, T, R, SIGMA, "PUT") if exercise == "european" else None)
+
+
+# Monte Carlo pricers under GBM (mu = r, so closed forms apply) and under the stochastic variance model
+def _monte_carlo(modules, name, n, dt, model, args, reference=None, **kwargs):
+    pricer = getattr(modules["simulations"], name)
+    if model == "svm":
+        alpha, beta, rho, div, vol_var = SVM
+        kwargs.update(alpha=alpha, beta=beta, rho=rho, div=div, vol_var=vol_var)
+        reference = None
+    return _result(n, "paths", pricer(*args(n, dt), **kwargs), reference)
+
+
+@benchmark("MonteCarloCall", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_call(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloCall", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T), black_scholes(S, K, T, R, SIGMA))
+
+
+@benchmark("MonteCarloPut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloPut", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T), black_scholes(S, K, T, R, SIGMA, "PUT"))
+
+
+@benchmark("MonteCarloBinaryCall", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_binary_call(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloBinaryCall", n, dt, model, lambda n, dt: (K, n, 50, R, S, R, SIGMA, dt, T), binary(S, K, T, R, SIGMA, 50))
+
+
+@benchmark("MonteCarloBinaryPut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_binary_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloBinaryPut", n, dt, model, lambda n, dt: (K, n, 50, R, S, R, SIGMA, dt, T), binary(S, K, T, R, SIGMA, 50, "PUT"))
+
+
+@benchmark("MonteCarloBarrierCall", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_barrier_call(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloBarrierCall", n, dt, model, lambda n, dt: (K, n, 150, R, S, R, SIGMA, dt, T), up=True, out=True)
+
+
+@benchmark("MonteCarloBarrierPut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_barrier_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloBarrierPut", n, dt, model, lambda n, dt: (K, n, 70, R, S, R, SIGMA, dt, T), up=False, out=True)
+
+
+@benchmark("MonteCarloAsianCall", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_asian_call(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloAsianCall", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T))
+
+
+@benchmark("MonteCarloAsianPut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_asian_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloAsianPut", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T))
+
+
+# Arithmetic Asian closed form approximation on monthly fixings, every strike of the chain in one call
+@benchmark("TurnbullWakemanAsianOption", chain=CHAINS)
+def turnbull_wakeman_asian_option(modules, chain):
+    modules["options"].TurnbullWakemanAsianOption(S, SIGMA, np.linspace(50, 150, chain), np.arange(1, 13)/12, R)
+    return _result(chain, "options")
+
+
+@benchmark("MonteCarloExtendibleCall", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_extendible_call(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloExtendibleCall", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T, .5))
+
+
+@benchmark("MonteCarloExtendiblePut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_extendible_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloExtendiblePut", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T, .5))
+
+
+# Bermudan put exercisable on every step of the grid
+@benchmark("MonteCarloAmericanPut", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_american_put(modules, n, dt, model):
+    return _monte_carlo(modules, "MonteCarloAmericanPut", n, dt, model, lambda n, dt: (K, n, R, S, R, SIGMA, dt, T))
+
+
+# Single precision paths: timed in float32, the error is against the float64 price from the same draws
+def _precision(modules, name, n, dt, model, args):
+    pricer = getattr(modules["simulations"], name)
+    kwargs = {}
+    if model == "svm":
+        alpha, beta, rho, div, vol_var = SVM
+        kwargs.update(alpha=alpha, beta=beta, rho=rho, div=div, vol_var=vol_var)
+    single = pricer(*args, rng=np.random.default_rng(n), precision="float32", **kwargs)
+
+    def check():
+        double = pricer(*args, rng=np.random.default_rng(n), **kwargs)
+        return {"error": abs(float(single.price) - float(double.price)), "standard_error": float(double.standard_error)}
+
+    return {"units": n, "unit": "paths", "check": check}
+
+
+@benchmark("MonteCarloCall float32", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_call_float32(modules, n, dt, model):
+    return _precision(modules, "MonteCarloCall", n, dt, model, (K, n, R, S, R, SIGMA, dt, T))
+
+
+@benchmark("MonteCarloAsianCall float32", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_asian_call_float32(modules, n, dt, model):
+    return _precision(modules, "MonteCarloAsianCall", n, dt, model, (K, n, R, S, R, SIGMA, dt, T))
+
+
+@benchmark("MonteCarloBarrierCall float32", n=PATHS, dt=STEPS, model=("gbm", "svm"))
+def monte_carlo_barrier_call_float32(modules, n, dt, model):
+    return _precision(modules, "MonteCarloBarrierCall", n, dt, model, (K, n, 150, R, S, R, SIGMA, dt, T))
+
+
+# seconds to import each module in a fresh interpreter, from -X importtime (cumulative microseconds)
+def import_times(repeat):
+    times = {}
+    for name in (PACKAGE, PACKAGE + ".options", PACKAGE + ".simulations"):
+        samples = []
+        for i in range(repeat):
+            process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + name], cwd=ROOT, capture_output=True, text=True)
+            if process.returncode:
+                break
+            for line in process.stderr.splitlines():
+                fields = line.split("|")
+                if len(fields) == 3 and fields[2].strip() == name:
+                    samples.append(int(fields[1])*1e-6)
+        if samples:
+            times[name] = min(samples)
+    return times
+
+
+def _grid(grid, quick):
+    combinations = [{}]
+    for key, values in grid.items():
+        if quick:
+            values = {PATHS: QUICK_PATHS, STEPS: QUICK_STEPS, CHAINS: QUICK_CHAINS}.get(values, values)
+        combinations = [dict(c, **{key: v}) for c in combinations for v in values]
+    return combinations
+
+
+def run_case(modules, fn, params, repeat, memory):
+    seconds = []
+    for i in range(repeat):
+        np.random.seed(i)
+        start = time.perf_counter()
+        result = fn(modules, **params)
+        seconds.append(time.perf_counter() - start)
+    # accuracy checks that should not be timed
+    if "check" in result:
+        result.update(result.pop("check")())
+    result["seconds"] = min(seconds)
+    result["median_seconds"] = statistics.median(seconds)
+    result["throughput"] = result["units"]/result["seconds"]
+    if memory:
+        np.random.seed(0)
+        tracemalloc.start()
+        fn(modules, **params)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(output, repeat=3, quick=False, memory=True, selection=None):
+    modules = load()
+    report = {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "import_seconds": import_times(repeat),
+        "results": [],
+    }
+    for name, grid, fn in CASES:
+        if selection and not any(s in name for s in selection):
+            continue
+        for params in _grid(grid, quick):
+            try:
+                result = run_case(modules, fn, params, repeat, memory)
+            except Exception as error:
+                result = {"failed": type(error).__name__ + ": " + str(error)}
+            result.update(name=name, params=params)
+            report["results"].append(result)
+            print(_describe(result), flush=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def _describe(result):
+    label = result["name"] + " " + " ".join(k + "=" + format(v, "g") if isinstance(v, float) else k + "=" + str(v) for k, v in result["params"].items())
+    if "failed" in result:
+        return label + "  failed: " + result["failed"]
+    text = label + "  %.4gs  %.4g %s/s" % (result["seconds"], result["throughput"], result["unit"])
+    if "peak_memory" in result:
+        text += "  %.3g MB" % (result["peak_memory"]/2**20)
+    if "error" in result:
+        text += "  error %.3g" % result["error"]
+    if "legacy_error" in result:
+        text += "  (legacy formula, %.3g from Black-Scholes)" % result["legacy_error"]
+    return text
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+# Flags cases that got slower than threshold (relative), grew their peak memory past threshold, or moved further
+# from the closed form than noise explains: beyond both twice the old error and four standard errors
+def compare(before, after, threshold=.1):
+    with open(before) as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    with open(after) as f:
+        report = json.load(f)
+    regressions = []
+    for result in report["results"]:
+        previous = old.get(_key(result))
+        if previous is None or "failed" in previous:
+            continue
+        label = _describe(result).split("  ")[0]
+        if "failed" in result:
+            regressions.append(label + "  now fails: " + result["failed"])
+            continue
+        ratio = result["seconds"]/previous["seconds"]
+        print(label + "  %.3gx time" % ratio + ("  %.3gx memory" % (result["peak_memory"]/max(previous["peak_memory"], 1)) if "peak_memory" in result and "peak_memory" in previous else ""))
+        if ratio > 1 + threshold:
+            regressions.append(label + "  %.3gx slower" % ratio)
+        if "peak_memory" in result and "peak_memory" in previous and result["peak_memory"] > (1 + threshold)*previous["peak_memory"]:
+            regressions.append(label + "  %.3gx memory" % (result["peak_memory"]/previous["peak_memory"]))
+        if "error" in result and "error" in previous:
+            tolerance = max(2*previous["error"], 4*result.get("standard_error", 0))
+            if result["error"] > tolerance:
+                regressions.append(label + "  error %.3g (was %.3g)" % (result["error"], previous["error"]))
+    before_imports = json.load(open(before)).get("import_seconds", {})
+    for name, seconds in report.get("import_seconds", {}).items():
+        if name in before_imports and seconds > (1 + threshold)*before_imports[name]:
+            regressions.append("import " + name + "  %.3gs (was %.3gs)" % (seconds, before_imports[name]))
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="QFin benchmark suite")
+    parser.add_argument("files", nargs="*", help="compare BEFORE AFTER: flag regressions between two result files")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="small grid")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory run")
+    parser.add_argument("--select", nargs="*", help="only cases whose name contains one of these")
+    parser.add_argument("--threshold", type=float, default=.1, help="relative slowdown counted as a regression")
+    args = parser.parse_args(arguments)
+    if args.files:
+        if len(args.files) != 3 or args.files[0] != "compare":
+            parser.error("usage: run.py compare BEFORE AFTER")
+        return 1 if compare(args.files[1], args.files[2], args.threshold) else 0
+    run(args.output, args.repeat, args.quick, not args.no_memory, args.select)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
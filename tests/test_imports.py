@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -X importtime rows of (module, self seconds, cumulative seconds) for a fresh interpreter
+def import_times(statement):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if line.startswith("import time:") and fields[0].strip().isdigit():
+            rows.append((fields[2].strip(), int(fields[0])*1e-6, int(fields[1])*1e-6))
+    return rows
+
+
+# SciPy is only imported by the features that need it (Sobol sampling, calibration, the PDE solver)
+def test_simulations_import_does_not_load_scipy():
+    modules = [module for module, own, cumulative in import_times("import QFin.simulations")]
+    assert "QFin.simulations" in modules
+    assert not [module for module in modules if module.split(".")[0] == "scipy"]
+
+
+# the package's own modules (excluding NumPy) load in well under a second; benchmarks/run.py tracks the totals
+def test_simulations_import_time():
+    rows = import_times("import QFin.simulations")
+    assert sum(own for module, own, cumulative in rows if module.split(".")[0] == "QFin") < 0.5
+    assert max(cumulative for module, own, cumulative in rows if module == "QFin.simulations") < 5